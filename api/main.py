@@ -1,9 +1,20 @@
-"""FastAPI app — thin wrappers around the shared query layer."""
+"""FastAPI app — thin wrappers around the shared query layer.
+
+Endpoints are async: DuckDB-backed queries run in the threadpool via
+run_in_threadpool, while parameter-free results (loaded once, then held in
+memory) are returned inline.
+"""
 
 from __future__ import annotations
 
-from fastapi import FastAPI, Query
+import zlib
+from pathlib import Path
+
+import orjson
+from fastapi import FastAPI, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from api import queries
 from api.models import (
@@ -31,11 +42,74 @@ app = FastAPI(
     ),
     version="0.1.0",
 )
+
+# ── HTTP caching ──
+# Responses only change when the parquets do, so the ETag is derived from the
+# data files' mtime (see queries.data_version) plus the request URL and can
+# be checked before querying.
+_CACHE_CONTROL = "public, max-age=600, stale-while-revalidate=3600"
+_CACHE_CONTROL_BY_PATH = {"/filters": "public, max-age=86400"}
+_UNCACHED_PATHS = {"/health", "/docs", "/redoc", "/openapi.json"}
+
+
+@app.middleware("http")
+async def http_cache_headers(request: Request, call_next):
+    """Add Cache-Control + weak ETag to GET responses; answer 304 on a match."""
+    if request.method != "GET" or request.url.path in _UNCACHED_PATHS:
+        return await call_next(request)
+
+    url_hash = zlib.crc32(f"{request.url.path}?{request.url.query}".encode())
+    etag = f'W/"{queries.data_version():x}-{url_hash:08x}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": _CACHE_CONTROL_BY_PATH.get(request.url.path, _CACHE_CONTROL),
+    }
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+
+    response = await call_next(request)
+    if response.status_code == 200:
+        response.headers.update(headers)
+    return response
+
+
+# Added after the caching middleware so CORS headers also wrap 304s
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
 
 
+class _ORJSONResponse(JSONResponse):
+    """JSON encoded straight from query rows with orjson.
+
+    Used by the large list endpoints to skip per-row Pydantic validation;
+    their models are still attached via ``responses=`` for the OpenAPI docs.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+
+def _json_array(batches):
+    """Encode batches of rows as one JSON array, a batch at a time.
+
+    Sync generator, so Starlette drives it (and the DuckDB fetches behind
+    it) in the threadpool.
+    """
+    yield b"["
+    first = True
+    for rows in batches:
+        if not rows:
+            continue
+        if not first:
+            yield b","
+        yield orjson.dumps(rows)[1:-1]
+        first = False
+    yield b"]"
+
+
 @app.get("/")
-def root():
+async def root():
     return {
         "message": "San Diego Climate Action API",
         "docs": "/docs",
@@ -51,113 +125,119 @@ def root():
 @app.get("/health")
 def health():
     """Debug endpoint — shows data path and file availability."""
-    from pathlib import Path
     agg = Path(queries._AGG)
-    files = sorted(p.name for p in agg.glob("*.parquet")) if agg.exists() else []
+    files = (
+        sorted(p.name for p in agg.iterdir() if p.suffix == ".parquet" or p.is_dir())
+        if agg.exists() else []
+    )
     return {"agg_path": str(agg), "exists": agg.exists(), "files": files}
 
 
 @app.get("/filters", response_model=FilterOptions)
-def filters():
+async def filters():
     """Available years, zip codes, permit categories, and policy eras."""
     return queries.get_filter_options()
 
 
 @app.get("/overview", response_model=OverviewResponse)
-def overview(
+async def overview(
     year_min: int = Query(2015, description="Start year"),
     year_max: int | None = Query(None, description="End year"),
 ):
     """KPIs: total solar permits, cumulative, solar %, median approval days."""
-    return queries.get_overview(year_min, year_max)
+    return await run_in_threadpool(queries.get_overview, year_min, year_max)
 
 
 @app.get("/solar-adoption", response_model=list[SolarAdoption])
-def solar_adoption(
+async def solar_adoption(
     year_min: int | None = Query(None, description="Start year"),
     year_max: int | None = Query(None, description="End year"),
 ):
     """Annual solar permit counts and cumulative S-curve."""
-    return queries.get_solar_adoption_curve(year_min, year_max)
+    return await run_in_threadpool(queries.get_solar_adoption_curve, year_min, year_max)
 
 
 @app.get("/solar-by-zip", response_model=list[SolarByZip])
-def solar_by_zip(
+async def solar_by_zip(
     year_min: int | None = Query(None, description="Start year"),
     year_max: int | None = Query(None, description="End year"),
     limit: int = Query(20, ge=1, le=200, description="Max zip codes"),
 ):
     """Top zip codes by solar permit count."""
-    return queries.get_solar_by_zip(year_min, year_max, limit)
+    return await run_in_threadpool(queries.get_solar_by_zip, year_min, year_max, limit)
 
 
-@app.get("/approval-speed", response_model=list[ApprovalSpeed])
-def approval_speed(
+@app.get("/approval-speed", responses={200: {"model": list[ApprovalSpeed]}})
+async def approval_speed(
     year_min: int | None = Query(None, description="Start year"),
     year_max: int | None = Query(None, description="End year"),
     permit_category: str | None = Query(None, description="Filter by permit category"),
 ):
     """Permit approval timeline metrics by category, year, and policy era."""
-    return queries.get_approval_speed(year_min, year_max, permit_category)
+    rows = await run_in_threadpool(queries.get_approval_speed, year_min, year_max, permit_category)
+    return _ORJSONResponse(rows)
 
 
 @app.get("/energy-permit-trends", response_model=list[EnergyPermitTrend])
-def energy_permit_trends(
+async def energy_permit_trends(
     year_min: int | None = Query(None, description="Start year"),
     year_max: int | None = Query(None, description="End year"),
 ):
     """Annual counts for solar, electrical, and mechanical permits."""
-    return queries.get_energy_permit_trends(year_min, year_max)
+    return await run_in_threadpool(queries.get_energy_permit_trends, year_min, year_max)
 
 
 @app.get("/zip-equity", response_model=list[ZipCodeEquity])
-def zip_equity(
+async def zip_equity(
     limit: int = Query(50, ge=1, le=200, description="Max zip codes"),
 ):
     """Zip code summary with solar adoption rates."""
     return queries.get_zip_code_equity(limit)
 
 
-@app.get("/monthly-trends", response_model=list[MonthlyTrend])
-def monthly_trends(
+@app.get("/monthly-trends", responses={200: {"model": list[MonthlyTrend]}})
+async def monthly_trends(
     year_min: int | None = Query(None, description="Start year"),
     year_max: int | None = Query(None, description="End year"),
     permit_category: str | None = Query(None, description="Filter by permit category"),
 ):
     """Monthly permit counts by category."""
-    return queries.get_monthly_trends(year_min, year_max, permit_category)
+    rows = await run_in_threadpool(queries.get_monthly_trends, year_min, year_max, permit_category)
+    return _ORJSONResponse(rows)
 
 
 @app.get("/policy-era-comparison", response_model=list[PolicyEraComparison])
-def policy_era_comparison():
+async def policy_era_comparison():
     """Compare solar permit speed across policy eras (Pre-CAP, CAP Adopted, Expedited Era)."""
     return queries.get_policy_era_comparison()
 
 
-@app.get("/solar-map", response_model=list[SolarMapPoint])
-def solar_map(
+@app.get("/solar-map", responses={200: {"model": list[SolarMapPoint]}})
+async def solar_map(
     year_min: int | None = Query(None, description="Start year"),
     year_max: int | None = Query(None, description="End year"),
     limit: int = Query(50000, ge=1, le=200000, description="Max points"),
 ):
     """Geo points for solar permit map visualization."""
-    return queries.get_solar_map_data(year_min, year_max, limit)
+    batches = queries.iter_solar_map_batches(year_min, year_max, limit)
+    return StreamingResponse(_json_array(batches), media_type="application/json")
 
 
-@app.get("/energy-consumption", response_model=list[EnergyConsumption])
-def energy_consumption(
+@app.get("/energy-consumption", responses={200: {"model": list[EnergyConsumption]}})
+async def energy_consumption(
     year_min: int | None = Query(None, description="Start year"),
     year_max: int | None = Query(None, description="End year"),
 ):
     """Citywide electricity and gas consumption trends (SDG&E data). Zip-level filtering not available."""
-    return queries.get_energy_consumption(year_min, year_max)
+    rows = await run_in_threadpool(queries.get_energy_consumption, year_min, year_max)
+    return _ORJSONResponse(rows)
 
 
 @app.get("/energy-vs-solar", response_model=list[EnergyVsSolar])
-def energy_vs_solar(
+async def energy_vs_solar(
     year_min: int | None = Query(None, description="Start year"),
     year_max: int | None = Query(None, description="End year"),
     limit: int = Query(30, ge=1, le=200, description="Max zip codes"),
 ):
     """Solar permits vs energy consumption by zip code (correlation analysis)."""
-    return queries.get_energy_vs_solar(year_min, year_max, limit)
+    return await run_in_threadpool(queries.get_energy_vs_solar, year_min, year_max, limit)
@@ -1,11 +1,15 @@
 """MCP server for San Diego climate action data.
 
-Exposes 12 tools that let Claude query climate/energy parquet files directly.
+Exposes 12 tools that let Claude query climate/energy parquet files directly,
+plus run_queries to batch several of them into one call.
 Uses FastMCP (v2) with stdio transport.
 """
 
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
 from fastmcp import FastMCP
 
 from api import queries
@@ -162,6 +166,48 @@ def get_energy_vs_solar(
     return queries.get_energy_vs_solar(year_min, year_max, limit)
 
 
+_DISPATCH: dict[str, Callable] = {
+    "get_filter_options": queries.get_filter_options,
+    "get_overview": queries.get_overview,
+    "get_solar_adoption_curve": queries.get_solar_adoption_curve,
+    "get_solar_by_zip": queries.get_solar_by_zip,
+    "get_approval_speed": queries.get_approval_speed,
+    "get_energy_permit_trends": queries.get_energy_permit_trends,
+    "get_zip_code_equity": queries.get_zip_code_equity,
+    "get_monthly_trends": queries.get_monthly_trends,
+    "get_policy_era_comparison": queries.get_policy_era_comparison,
+    "get_solar_map_data": queries.get_solar_map_data,
+    "get_energy_consumption": queries.get_energy_consumption,
+    "get_energy_vs_solar": queries.get_energy_vs_solar,
+}
+
+
+@mcp.tool()
+def run_queries(specs: list[dict]) -> dict:
+    """Run several of the tools above in one call, concurrently.
+
+    Each spec is {"name": "<tool name>", "args": {...}} with an optional "key"
+    to label the result (defaults to the name; set it when repeating a tool).
+    Returns {key: result}. Example:
+    [{"name": "get_overview"}, {"name": "get_zip_code_equity", "args": {"limit": 10}}]
+    """
+    keys: set[str] = set()
+    for spec in specs:
+        if spec.get("name") not in _DISPATCH:
+            raise ValueError(f"Unknown query {spec.get('name')!r}; expected one of {sorted(_DISPATCH)}")
+        key = spec.get("key", spec["name"])
+        if key in keys:
+            raise ValueError(f"Duplicate result key {key!r}; give repeated tools distinct \"key\" values")
+        keys.add(key)
+
+    with ThreadPoolExecutor(max_workers=min(len(specs), 8) or 1) as pool:
+        futures = {
+            spec.get("key", spec["name"]): pool.submit(_DISPATCH[spec["name"]], **spec.get("args", {}))
+            for spec in specs
+        }
+        return {key: future.result() for key, future in futures.items()}
+
+
 def main():
     mcp.run()
 
@@ -2,12 +2,17 @@
 
 Both FastAPI endpoints and MCP tools call these functions.
 Each function queries pre-aggregated parquet files via DuckDB
-and returns list[dict] or dict.
+and returns list[dict] or dict. Results are memoized per argument
+tuple for a few minutes (see ``_cached``).
 """
 
 from __future__ import annotations
 
+import functools
+import threading
+import time
 from pathlib import Path
+from typing import Callable, Iterator, TypeVar
 
 import duckdb
 
@@ -15,118 +20,234 @@ _ROOT = Path(__file__).resolve().parent.parent
 _AGG = str(_ROOT / "data" / "aggregated")
 _PROCESSED = str(_ROOT / "data" / "processed")
 
+# One in-memory database for the process; each call works on its own cursor
+# so concurrent requests don't share a connection handle.
+_CON = duckdb.connect()
+_CON.execute("SET enable_object_cache = true")
+
+
+def _register_views() -> None:
+    """Expose each aggregated parquet as a view named after the file.
+
+    Queries reference the view name, and with the object cache enabled
+    DuckDB keeps each file's footer/statistics between calls. Directories
+    are hive-partitioned datasets (e.g. solar_map_points/year=2020/), so
+    filters on the partition column prune whole files. Nothing is
+    registered when the pipeline hasn't run yet, so the app still starts
+    and ``/health`` can report the missing data.
+    """
+    if not Path(_AGG).exists():
+        return
+    for path in sorted(Path(_AGG).iterdir()):
+        if path.is_dir():
+            source = f"read_parquet('{path}/*/*.parquet', hive_partitioning = true)"
+        elif path.suffix == ".parquet" and path.with_suffix("").is_dir():
+            continue  # stale single-file copy of a partitioned dataset
+        elif path.suffix == ".parquet":
+            source = f"read_parquet('{path}')"
+        else:
+            continue
+        _CON.execute(f"CREATE OR REPLACE VIEW {path.stem} AS SELECT * FROM {source}")
+
+
+_register_views()
+
+# Parquets only change when the pipeline reruns, so results are reusable.
+_CACHE_TTL = 600  # seconds
+_CACHE_MAXSIZE = 512
+# cache_clear of every memoized query, dropped together when the data changes
+_CACHE_CLEARS: list[Callable[[], None]] = []
+
+_DATA_VERSION_TTL = 5  # seconds
+_data_version = (time.monotonic(), max(
+    (p.stat().st_mtime_ns for p in Path(_AGG).rglob("*.parquet")), default=0
+))
+_data_version_lock = threading.Lock()
+
+
+def data_version() -> int:
+    """Newest mtime (ns) among the aggregated parquets, re-read every few seconds.
+
+    When it moves (a pipeline rerun, or the first run after the service
+    started without data) the views are re-registered and every query cache
+    is dropped, so results and the API's ETags change together.
+    """
+    global _data_version
+    checked_at, version = _data_version
+    now = time.monotonic()
+    if now - checked_at < _DATA_VERSION_TTL:
+        return version
+    with _data_version_lock:
+        latest = max((p.stat().st_mtime_ns for p in Path(_AGG).rglob("*.parquet")), default=0)
+        if latest != _data_version[1]:
+            _register_views()
+            for clear in _CACHE_CLEARS:
+                clear()
+        _data_version = (now, latest)
+    return latest
+
+_F = TypeVar("_F", bound=Callable)
+
+
+def _cached(fn: _F) -> _F:
+    """Memoize a query function on its arguments for ``_CACHE_TTL`` seconds.
+
+    Cached results are shared between callers and must not be mutated.
+    The cache holds up to ``_CACHE_MAXSIZE`` entries whatever their size,
+    so only use it for functions with small results.
+    """
+    cache: dict[tuple, tuple[float, object]] = {}
+    lock = threading.Lock()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        now = time.monotonic()
+        with lock:
+            hit = cache.get(key)
+        if hit is not None and now - hit[0] < _CACHE_TTL:
+            return hit[1]
+        result = fn(*args, **kwargs)
+        with lock:
+            if key not in cache and len(cache) >= _CACHE_MAXSIZE:
+                cache.pop(next(iter(cache)))
+            cache[key] = (now, result)
+        return result
+
+    wrapper.cache_clear = cache.clear
+    _CACHE_CLEARS.append(cache.clear)
+    return wrapper
+
 
 def _pq(name: str) -> str:
     """Return full path to an aggregated parquet file."""
     return f"{_AGG}/{name}.parquet"
 
 
-def _q(where: str, condition: str) -> str:
-    """Append a condition to a WHERE clause."""
-    if not where:
-        return f"WHERE {condition}"
-    return f"{where} AND {condition}"
+# (name, clause, cast) in the argument order of the builders from _make_where.
+_FILTERS = (
+    ("year_min", "year >= $year_min", int),
+    ("year_max", "year <= $year_max", int),
+    ("zip_code", "zip_code = $zip_code", str),
+    ("permit_category", "permit_category = $permit_category", str),
+    ("policy_era", "policy_era = $policy_era", str),
+)
+
+
+def _make_where(allowed: frozenset[str]) -> Callable[..., tuple[str, dict]]:
+    """Build a WHERE-clause builder that only checks the ``allowed`` filters.
+
+    Which filters a query supports is fixed per query, so that is resolved
+    once here and the returned function only inspects those values. Values
+    are bound as ``$name`` parameters so the SQL text is the same for every
+    call with the same set of filters.
+    """
+    checks = tuple(
+        (i, name, clause, cast)
+        for i, (name, clause, cast) in enumerate(_FILTERS)
+        if name in allowed
+    )
 
+    def where(
+        year_min: int | None = None,
+        year_max: int | None = None,
+        zip_code: str | None = None,
+        permit_category: str | None = None,
+        policy_era: str | None = None,
+    ) -> tuple[str, dict]:
+        values = (year_min, year_max, zip_code, permit_category, policy_era)
+        clauses: list[str] = []
+        params: dict = {}
+        for i, name, clause, cast in checks:
+            value = values[i]
+            if value is None or value == "":
+                continue
+            clauses.append(clause)
+            params[name] = cast(value)
+        return (("WHERE " + " AND ".join(clauses)) if clauses else ""), params
 
-def _where(
-    year_min: int | None = None,
-    year_max: int | None = None,
-    zip_code: str | None = None,
-    permit_category: str | None = None,
-    policy_era: str | None = None,
-    *,
-    has_zip: bool = True,
-    has_category: bool = True,
-    has_era: bool = True,
-) -> str:
-    """Build a WHERE clause from optional filter params."""
-    clauses: list[str] = []
-    if year_min is not None:
-        clauses.append(f"year >= {int(year_min)}")
-    if year_max is not None:
-        clauses.append(f"year <= {int(year_max)}")
-    if zip_code and has_zip:
-        clauses.append(f"zip_code = '{zip_code.replace(chr(39), chr(39)*2)}'")
-    if permit_category and has_category:
-        clauses.append(f"permit_category = '{permit_category.replace(chr(39), chr(39)*2)}'")
-    if policy_era and has_era:
-        clauses.append(f"policy_era = '{policy_era.replace(chr(39), chr(39)*2)}'")
-    return ("WHERE " + " AND ".join(clauses)) if clauses else ""
-
-
-def _run(sql: str) -> list[dict]:
-    """Execute SQL and return list of row dicts."""
-    con = duckdb.connect()
-    df = con.execute(sql).fetchdf()
-    con.close()
-    return df.to_dict(orient="records")
+    return where
+
+
+_where_years = _make_where(frozenset({"year_min", "year_max"}))
+_where_years_category = _make_where(frozenset({"year_min", "year_max", "permit_category"}))
+
+
+def _run(sql: str, params: dict | None = None) -> list[dict]:
+    """Execute SQL and return list of row dicts.
+
+    Rows go through Arrow rather than pandas. Arrow maps HUGEINT (the
+    result of SUM over BIGINT) to Decimal, so cast sums to BIGINT.
+    """
+    with _CON.cursor() as cur:
+        return cur.execute(sql, params or {}).fetch_arrow_table().to_pylist()
 
 
 # ── 1. Filter options ──
 
 
-def get_filter_options() -> dict:
-    """Return available years, zip_codes, permit_categories, policy_eras."""
-    con = duckdb.connect()
-    pq = _pq("solar_annual")
-    years = sorted(
-        con.execute(f"SELECT DISTINCT year FROM '{pq}' ORDER BY year")
-        .fetchdf()["year"].tolist()
-    )
+# Parameter-free results are computed once, on first call (also zip equity
+# and policy era comparison below). Not at import: with no aggregates yet the
+# app must still start, and a failed load isn't cached, so it retries.
 
-    pq_zip = _pq("zip_code_summary")
-    zips = sorted(
-        con.execute(f"SELECT DISTINCT zip_code FROM '{pq_zip}' WHERE zip_code IS NOT NULL ORDER BY zip_code")
-        .fetchdf()["zip_code"].tolist()
-    )
 
-    pq_speed = _pq("approval_speed")
-    categories = sorted(
-        con.execute(f"SELECT DISTINCT permit_category FROM '{pq_speed}' ORDER BY permit_category")
-        .fetchdf()["permit_category"].tolist()
-    )
+@functools.cache
+def _load_filter_options() -> dict:
+    def column(sql: str) -> list:
+        return con.execute(sql).fetch_arrow_table().column(0).to_pylist()
 
-    eras = sorted(
-        con.execute(f"SELECT DISTINCT policy_era FROM '{pq_speed}' WHERE policy_era IS NOT NULL ORDER BY policy_era")
-        .fetchdf()["policy_era"].tolist()
-    )
+    with _CON.cursor() as con:
+        years = column("SELECT DISTINCT year FROM solar_annual ORDER BY year")
+        zips = column("SELECT DISTINCT zip_code FROM zip_code_summary WHERE zip_code IS NOT NULL ORDER BY zip_code")
+        categories = column("SELECT DISTINCT permit_category FROM approval_speed ORDER BY permit_category")
+        eras = column("SELECT DISTINCT policy_era FROM approval_speed WHERE policy_era IS NOT NULL ORDER BY policy_era")
 
-    con.close()
     return {
-        "years": [int(y) for y in years],
+        "years": years,
         "zip_codes": zips,
         "permit_categories": categories,
         "policy_eras": eras,
     }
 
 
+_CACHE_CLEARS.append(_load_filter_options.cache_clear)
+
+
+def get_filter_options() -> dict:
+    """Return available years, zip_codes, permit_categories, policy_eras."""
+    return _load_filter_options()
+
+
 # ── 2. Overview ──
 
 
+@_cached
 def get_overview(
     year_min: int | None = 2015,
     year_max: int | None = None,
 ) -> dict:
     """KPIs: total solar, cumulative, solar %, median approval days."""
-    con = duckdb.connect()
-    w = _where(year_min, year_max, has_zip=False, has_category=False, has_era=False)
-
-    row = con.execute(f"""
-        SELECT
-            COALESCE(SUM(solar_count), 0) AS total_solar,
-            MAX(cumulative_solar) AS cumulative_solar,
-            COALESCE(MEDIAN(median_approval_days), 0) AS median_approval_days
-        FROM '{_pq("solar_annual")}' {w}
-    """).fetchone()
-
-    # Total permits for solar % calculation
-    w2 = _where(year_min, year_max, has_zip=False, has_category=False, has_era=False)
-    total_permits = con.execute(f"""
-        SELECT COALESCE(SUM(permit_count), 0)
-        FROM '{_pq("climate_permits_monthly")}' {w2}
-    """).fetchone()[0]
-
-    con.close()
+    w, params = _where_years(year_min, year_max)
+
+    # Solar KPIs and the permit total (for solar %) in one round-trip
+    with _CON.cursor() as con:
+        row = con.execute(f"""
+            WITH solar AS (
+                SELECT
+                    COALESCE(SUM(solar_count), 0) AS total_solar,
+                    MAX(cumulative_solar) AS cumulative_solar,
+                    COALESCE(MEDIAN(median_approval_days), 0) AS median_approval_days
+                FROM solar_annual {w}
+            ),
+            permits AS (
+                SELECT COALESCE(SUM(permit_count), 0) AS total_permits
+                FROM climate_permits_monthly {w}
+            )
+            SELECT solar.*, permits.total_permits
+            FROM solar, permits
+        """, params).fetchone()
+
+    total_permits = row[3]
     solar_pct = (row[0] / total_permits * 100) if total_permits else 0
     return {
         "total_solar": int(row[0]),
@@ -139,117 +260,131 @@ def get_overview(
 # ── 3. Solar adoption curve ──
 
 
+@_cached
 def get_solar_adoption_curve(
     year_min: int | None = None,
     year_max: int | None = None,
 ) -> list[dict]:
     """Annual solar count + cumulative (the S-curve)."""
-    w = _where(year_min, year_max, has_zip=False, has_category=False, has_era=False)
+    w, params = _where_years(year_min, year_max)
     return _run(f"""
         SELECT year, solar_count, cumulative_solar, total_valuation, median_approval_days
-        FROM '{_pq("solar_annual")}' {w}
+        FROM solar_annual {w}
         ORDER BY year
-    """)
+    """, params)
 
 
 # ── 4. Solar by zip ──
 
 
+@_cached
 def get_solar_by_zip(
     year_min: int | None = None,
     year_max: int | None = None,
     limit: int = 20,
 ) -> list[dict]:
     """Ranked zip codes by solar permit count."""
-    w = _where(year_min, year_max, has_category=False, has_era=False)
+    w, params = _where_years(year_min, year_max)
     return _run(f"""
-        SELECT zip_code, SUM(solar_count) AS solar_count,
-               SUM(total_valuation) AS total_valuation
-        FROM '{_pq("solar_by_zip")}' {w}
+        SELECT zip_code, SUM(solar_count)::BIGINT AS solar_count,
+               SUM(total_valuation)::BIGINT AS total_valuation
+        FROM solar_by_zip {w}
         GROUP BY zip_code
         ORDER BY solar_count DESC
-        LIMIT {int(limit)}
-    """)
+        LIMIT $limit
+    """, {**params, "limit": int(limit)})
 
 
 # ── 5. Approval speed ──
 
 
+@_cached
 def get_approval_speed(
     year_min: int | None = None,
     year_max: int | None = None,
     permit_category: str | None = None,
 ) -> list[dict]:
     """Timeline metrics by category/year/era."""
-    w = _where(year_min, year_max, permit_category=permit_category, has_zip=False)
+    w, params = _where_years_category(year_min, year_max, permit_category=permit_category)
     return _run(f"""
         SELECT year, permit_category, policy_era, permit_count,
                median_days, avg_days, p90_days
-        FROM '{_pq("approval_speed")}' {w}
+        FROM approval_speed {w}
         ORDER BY year, permit_category
-    """)
+    """, params)
 
 
 # ── 6. Energy permit trends ──
 
 
+@_cached
 def get_energy_permit_trends(
     year_min: int | None = None,
     year_max: int | None = None,
 ) -> list[dict]:
     """Annual solar/electrical/mechanical counts."""
-    w = _where(year_min, year_max, has_zip=False, has_category=False, has_era=False)
+    w, params = _where_years(year_min, year_max)
     return _run(f"""
         SELECT year, solar_count, electrical_count, mechanical_count, climate_total
-        FROM '{_pq("energy_permits_annual")}' {w}
+        FROM energy_permits_annual {w}
         ORDER BY year
-    """)
+    """, params)
 
 
 # ── 7. Zip code equity ──
 
 
-def get_zip_code_equity(limit: int = 50) -> list[dict]:
-    """Zip summary with solar adoption rates."""
-    return _run(f"""
+# Full ranking, materialized once and sliced per request. zip_code breaks
+# ties so the top-N is stable across restarts (matters for cached ETags).
+@functools.cache
+def _load_zip_equity() -> list[dict]:
+    return _run("""
         SELECT zip_code, total_permits, solar_count, electrical_count,
                mechanical_count, climate_count, solar_pct, total_valuation
-        FROM '{_pq("zip_code_summary")}'
-        ORDER BY solar_count DESC
-        LIMIT {int(limit)}
+        FROM zip_code_summary
+        ORDER BY solar_count DESC, zip_code
     """)
 
 
+_CACHE_CLEARS.append(_load_zip_equity.cache_clear)
+
+
+def get_zip_code_equity(limit: int = 50) -> list[dict]:
+    """Zip summary with solar adoption rates."""
+    return _load_zip_equity()[:int(limit)]
+
+
 # ── 8. Monthly trends ──
 
 
+@_cached
 def get_monthly_trends(
     year_min: int | None = None,
     year_max: int | None = None,
     permit_category: str | None = None,
 ) -> list[dict]:
     """Monthly detail by permit_category."""
-    w = _where(year_min, year_max, permit_category=permit_category, has_zip=False, has_era=False)
+    w, params = _where_years_category(year_min, year_max, permit_category=permit_category)
     return _run(f"""
         SELECT year, month, permit_category, permit_count
-        FROM '{_pq("climate_permits_monthly")}' {w}
+        FROM climate_permits_monthly {w}
         ORDER BY year, month, permit_category
-    """)
+    """, params)
 
 
 # ── 9. Policy era comparison ──
 
 
-def get_policy_era_comparison() -> list[dict]:
-    """Pre-CAP vs post-CAP vs expedited era (solar only)."""
-    return _run(f"""
+@functools.cache
+def _load_policy_era_comparison() -> list[dict]:
+    return _run("""
         SELECT
             policy_era,
-            SUM(permit_count) AS total_permits,
+            SUM(permit_count)::BIGINT AS total_permits,
             MEDIAN(median_days) AS median_days,
             AVG(avg_days)::INTEGER AS avg_days,
             AVG(p90_days)::INTEGER AS p90_days
-        FROM '{_pq("approval_speed")}'
+        FROM approval_speed
         WHERE permit_category = 'Solar/PV' AND policy_era IS NOT NULL
         GROUP BY policy_era
         ORDER BY CASE policy_era
@@ -260,91 +395,108 @@ def get_policy_era_comparison() -> list[dict]:
     """)
 
 
+_CACHE_CLEARS.append(_load_policy_era_comparison.cache_clear)
+
+
+def get_policy_era_comparison() -> list[dict]:
+    """Pre-CAP vs post-CAP vs expedited era (solar only)."""
+    return _load_policy_era_comparison()
+
+
 # ── 10. Solar map data ──
 
 
+def _solar_map_sql(year_min: int | None, year_max: int | None, limit: int) -> tuple[str, dict]:
+    w, params = _where_years(year_min, year_max)
+    # Reservoir sample is one pass with bounded memory (no full random sort).
+    # USING SAMPLE applies before WHERE, so filter in a subquery first.
+    return f"""
+        SELECT lat, lng, year, valuation, zip_code, approval_days, policy_era
+        FROM (
+            SELECT lat, lng, year, valuation, zip_code, approval_days, policy_era
+            FROM solar_map_points {w}
+        )
+        USING SAMPLE {int(limit)} ROWS (reservoir)
+    """, params
+
+
 def get_solar_map_data(
     year_min: int | None = None,
     year_max: int | None = None,
     limit: int = 50000,
 ) -> list[dict]:
-    """Geo points for solar permit mapping."""
-    w = _where(year_min, year_max, has_zip=False, has_category=False, has_era=False)
-    return _run(f"""
-        SELECT lat, lng, year, valuation, zip_code, approval_days, policy_era
-        FROM '{_pq("solar_map_points")}' {w}
-        ORDER BY RANDOM()
-        LIMIT {int(limit)}
-    """)
+    """Geo points for solar permit mapping.
+
+    Not memoized: a result can be tens of thousands of rows, and the
+    ``_cached`` bound is an entry count, not a size.
+    """
+    return _run(*_solar_map_sql(year_min, year_max, limit))
+
+
+def iter_solar_map_batches(
+    year_min: int | None = None,
+    year_max: int | None = None,
+    limit: int = 50000,
+    batch_size: int = 8192,
+) -> Iterator[list[dict]]:
+    """Same rows as get_solar_map_data, yielded in batches for streaming.
+
+    Not memoized — the point is to never hold the full result in Python.
+    """
+    sql, params = _solar_map_sql(year_min, year_max, limit)
+    with _CON.cursor() as cur:
+        reader = cur.execute(sql, params).fetch_record_batch(batch_size)
+        for batch in reader:
+            yield batch.to_pylist()
 
 
 # ── 11. Energy consumption ──
 
 
+@_cached
 def get_energy_consumption(
     year_min: int | None = None,
     year_max: int | None = None,
 ) -> list[dict]:
     """Electricity + gas consumption trends from SDG&E data (citywide aggregates, zip-level filtering not available)."""
-    pq = _pq("energy_trends")
-    if not Path(f"{_AGG}/energy_trends.parquet").exists():
+    if not Path(_pq("energy_trends")).exists():
         return []
-    w = _where(year_min, year_max, has_category=False, has_era=False, has_zip=False)
+    w, params = _where_years(year_min, year_max)
     return _run(f"""
         SELECT year, quarter, customer_class,
-               total_kwh, elec_customers,
-               total_thm, gas_customers
-        FROM '{pq}' {w}
+               total_kwh, elec_customers::BIGINT AS elec_customers,
+               total_thm, gas_customers::BIGINT AS gas_customers
+        FROM energy_trends {w}
         ORDER BY year, quarter, customer_class
-    """)
+    """, params)
 
 
 # ── 12. Energy vs solar ──
 
 
+@_cached
 def get_energy_vs_solar(
     year_min: int | None = None,
     year_max: int | None = None,
     limit: int = 30,
 ) -> list[dict]:
     """Join solar permits with energy consumption by zip to show correlation."""
-    pq_energy = _pq("energy_by_zip_annual")
-    pq_solar = _pq("solar_by_zip")
-    if not Path(f"{_AGG}/energy_by_zip_annual.parquet").exists():
+    if not Path(_pq("energy_vs_solar_by_zip")).exists():
         return []
 
-    w_solar = ""
-    w_energy = ""
-    if year_min is not None:
-        w_solar = _q(w_solar, f"s.year >= {int(year_min)}")
-        w_energy = _q(w_energy, f"e.year >= {int(year_min)}")
-    if year_max is not None:
-        w_solar = _q(w_solar, f"s.year <= {int(year_max)}")
-        w_energy = _q(w_energy, f"e.year <= {int(year_max)}")
-
+    # Pre-joined per (zip, year) by the pipeline; a zip needs solar permits
+    # and energy data within the year range to be included.
+    w, params = _where_years(year_min, year_max)
     return _run(f"""
-        WITH solar_totals AS (
-            SELECT zip_code, SUM(solar_count) AS solar_count
-            FROM '{pq_solar}'
-            {w_solar.replace('s.', '')}
-            GROUP BY zip_code
-        ),
-        energy_totals AS (
-            SELECT zip_code,
-                   AVG(avg_kwh_per_customer)::INTEGER AS avg_kwh_per_customer,
-                   SUM(total_kwh)::BIGINT AS total_kwh
-            FROM '{pq_energy}'
-            {w_energy.replace('e.', '')}
-            GROUP BY zip_code
-        )
         SELECT
-            s.zip_code,
-            s.solar_count,
-            e.avg_kwh_per_customer,
-            e.total_kwh
-        FROM solar_totals s
-        JOIN energy_totals e ON s.zip_code = e.zip_code
-        WHERE e.avg_kwh_per_customer IS NOT NULL
-        ORDER BY s.solar_count DESC
-        LIMIT {int(limit)}
-    """)
+            zip_code,
+            SUM(solar_count)::BIGINT AS solar_count,
+            AVG(avg_kwh_per_customer)::INTEGER AS avg_kwh_per_customer,
+            SUM(total_kwh)::BIGINT AS total_kwh
+        FROM energy_vs_solar_by_zip {w}
+        GROUP BY zip_code
+        HAVING SUM(solar_count) IS NOT NULL
+           AND AVG(avg_kwh_per_customer) IS NOT NULL
+        ORDER BY solar_count DESC
+        LIMIT $limit
+    """, {**params, "limit": int(limit)})
@@ -2,13 +2,17 @@
 
 from __future__ import annotations
 
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
 from pathlib import Path
 
 import duckdb
-import plotly.express as px
 import plotly.graph_objects as go
+import pyarrow as pa
 import pydeck as pdk
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # ── Parquet paths ──
 _root = Path(__file__).resolve().parent.parent
@@ -36,45 +40,150 @@ ELEC_COLOR = "#00B4D8"
 MECH_COLOR = "#E63946"
 
 
-def query(sql: str):
-    """Run SQL against parquet files and return a pandas DataFrame."""
+@st.cache_resource
+def _con() -> duckdb.DuckDBPyConnection:
+    """One in-process DuckDB shared by every query, rerun, and session.
+
+    Thread count and memory are pinned rather than inherited, since
+    containers often report the host's cores; the object cache keeps
+    parquet footers between queries. Every aggregated/processed parquet is
+    registered as a view named after the file, so queries say
+    ``FROM solar_annual``; directories are hive-partitioned datasets.
+    """
     con = duckdb.connect()
-    return con.execute(sql).fetchdf()
+    con.execute(f"SET threads = {min(8, os.cpu_count() or 1)}")
+    con.execute("SET memory_limit = '2GB'")
+    con.execute("SET enable_object_cache = true")
+    for path in sorted([*Path(_AGG).iterdir(), *Path(_PROCESSED).glob("*.parquet")]):
+        if path.is_dir():
+            source = f"read_parquet('{path}/*/*.parquet', hive_partitioning = true)"
+        elif path.suffix == ".parquet" and path.with_suffix("").is_dir():
+            continue  # stale single-file copy of a partitioned dataset
+        elif path.suffix == ".parquet":
+            source = f"read_parquet('{path}')"
+        else:
+            continue
+        con.execute(f"CREATE OR REPLACE VIEW {path.stem} AS SELECT * FROM {source}")
+    return con
+
+
+@st.cache_data(ttl=3600, max_entries=256)
+def query(sql: str, params: dict | None = None):
+    """Run SQL against parquet files and return a pandas DataFrame.
+
+    Filter values are bound as ``$name`` parameters (see ``_where``), and
+    results are cached per (SQL, params), so reruns that don't change a
+    filter skip DuckDB entirely. Each call
+    gets its own cursor — Streamlit sessions run on separate threads, and
+    cursors are the thread-safe handle on a shared connection.
+    """
+    with _con().cursor() as cur:
+        return cur.execute(sql, params or {}).fetchdf()
+
+
+@st.cache_data(ttl=3600, max_entries=256)
+def query_arrow(sql: str, params: dict | None = None) -> pa.Table:
+    """Like query(), but returns the Arrow table without a pandas round-trip.
+
+    For chart-only results: pass columns to Plotly with ``_col(t, name)``.
+    Arrow maps HUGEINT (SUM over BIGINT) to Decimal, so cast sums to BIGINT.
+    """
+    with _con().cursor() as cur:
+        return cur.execute(sql, params or {}).fetch_arrow_table()
+
+
+@st.cache_data(ttl=3600, max_entries=256)
+def query_one(sql: str, params: dict | None = None) -> dict | None:
+    """First row of a query as {column: value} via fetchone(), no DataFrame.
+
+    For single-row KPI/summary queries.
+    """
+    with _con().cursor() as cur:
+        row = cur.execute(sql, params or {}).fetchone()
+        if row is None:
+            return None
+        return dict(zip((col[0] for col in cur.description), row))
+
+
+def _col(table: pa.Table, name: str):
+    """A column of an Arrow result as a numpy array for Plotly."""
+    return table.column(name).to_numpy()
+
+
+def _lines_by(fig: go.Figure, x, y, groups, **trace_kwargs) -> go.Figure:
+    """Add one line trace per distinct value of ``groups``, in first-seen order.
+
+    The go.* equivalent of ``px.line(..., color=...)`` over numpy arrays.
+    """
+    for name in dict.fromkeys(groups.tolist()):
+        mask = groups == name
+        fig.add_trace(go.Scatter(x=x[mask], y=y[mask], mode="lines", name=name, **trace_kwargs))
+    return fig
+
+
+def qmany(sqls: dict, params: dict | None = None, run=query) -> dict:
+    """Run independent queries concurrently; returns {name: result}.
+
+    Values are SQL strings (executed with ``run``) or ``(runner, sql)``
+    pairs. All queries are bound with the same ``params``.
+
+    DuckDB releases the GIL while executing, so a tab's queries overlap and
+    it waits for the slowest one instead of their sum. Each worker gets this
+    script run's context attached, so the cached runners can still show
+    their spinner on a cache miss (without it Streamlit warns about a
+    missing ScriptRunContext and skips it).
+    """
+    with ThreadPoolExecutor(
+        max_workers=len(sqls),
+        initializer=add_script_run_ctx,
+        initargs=(None, get_script_run_ctx()),
+    ) as pool:
+        futures = {
+            name: pool.submit(*(spec if isinstance(spec, tuple) else (run, spec)), params)
+            for name, spec in sqls.items()
+        }
+        return {name: f.result() for name, f in futures.items()}
 
 
 # ── Sidebar filters ──
 st.sidebar.title("Filters")
 
 
-@st.cache_data(ttl=3600)
-def _sidebar_options():
-    years = sorted(
-        query(f"SELECT DISTINCT year FROM '{_pq('solar_annual')}' ORDER BY year")
-        ["year"].tolist()
-    )
-    categories = sorted(
-        query(f"SELECT DISTINCT permit_category FROM '{_pq('approval_speed')}' ORDER BY permit_category")
-        ["permit_category"].tolist()
-    )
-    zips = sorted(
-        query(f"SELECT DISTINCT zip_code FROM '{_pq('zip_code_summary')}' WHERE zip_code IS NOT NULL ORDER BY zip_code")
-        ["zip_code"].tolist()
-    )
-    eras = sorted(
-        query(f"SELECT DISTINCT policy_era FROM '{_pq('approval_speed')}' WHERE policy_era IS NOT NULL ORDER BY policy_era")
-        ["policy_era"].tolist()
-    )
-    return years, categories, zips, eras
+_OPTION_SOURCES = ("solar_annual", "approval_speed", "zip_code_summary")
 
 
-all_years, all_categories, all_zips, all_eras = _sidebar_options()
+@st.cache_data(persist="disk", show_spinner=False)
+def _sidebar_options(data_mtime: int):
+    """Sidebar option lists, persisted to disk so cold starts skip DuckDB.
+
+    ``data_mtime`` only keys the cache: it changes when the pipeline rewrites
+    the source parquets. (Persisted caches don't support ttl.)
+    """
+    # One query for all four option lists; each arrives already ordered by
+    # DuckDB, so nothing is re-sorted or regrouped in Python.
+    opts = query_one("""
+        SELECT
+            (SELECT list(DISTINCT year ORDER BY year) FROM solar_annual) AS years,
+            (SELECT list(DISTINCT permit_category ORDER BY permit_category)
+             FROM approval_speed) AS categories,
+            (SELECT list(DISTINCT zip_code ORDER BY zip_code)
+             FROM zip_code_summary WHERE zip_code IS NOT NULL) AS zips,
+            (SELECT list(DISTINCT policy_era ORDER BY policy_era)
+             FROM approval_speed WHERE policy_era IS NOT NULL) AS eras
+    """)
+    return (opts["years"] or [], opts["categories"] or [],
+            opts["zips"] or [], opts["eras"] or [])
+
+all_years, all_categories, all_zips, all_eras = _sidebar_options(
+    max(Path(_pq(name)).stat().st_mtime_ns for name in _OPTION_SOURCES)
+)
 
 if all_years:
     year_range = st.sidebar.slider(
         "Year Range",
-        min_value=int(min(all_years)),
-        max_value=int(max(all_years)),
-        value=(2015, int(max(all_years))),
+        min_value=all_years[0],
+        max_value=all_years[-1],
+        value=(2015, all_years[-1]),
     )
 else:
     year_range = (2015, 2026)
@@ -103,26 +212,29 @@ selected_era = st.sidebar.selectbox(
 )
 
 
-def _year_filter(col: str = "year") -> str:
-    return f"{col} BETWEEN {year_range[0]} AND {year_range[1]}"
+# Each filter returns (sql_fragment, params); values are bound, never inlined.
+def _year_filter(col: str = "year") -> tuple[str, dict]:
+    return f"{col} BETWEEN $year_min AND $year_max", {"year_min": year_range[0], "year_max": year_range[1]}
 
 
-def _cat_filter(col: str = "permit_category") -> str:
+def _cat_filter(col: str = "permit_category") -> tuple[str, dict]:
     if not selected_categories:
-        return ""
-    escaped = ", ".join(f"'{c.replace(chr(39), chr(39)*2)}'" for c in selected_categories)
-    return f"{col} IN ({escaped})"
+        return "", {}
+    names = [f"category_{i}" for i in range(len(selected_categories))]
+    placeholders = ", ".join(f"${n}" for n in names)
+    return f"{col} IN ({placeholders})", dict(zip(names, selected_categories))
 
 
-def _era_filter(col: str = "policy_era") -> str:
+def _era_filter(col: str = "policy_era") -> tuple[str, dict]:
     if selected_era == "All":
-        return ""
-    return f"{col} = '{selected_era}'"
+        return "", {}
+    return f"{col} = $policy_era", {"policy_era": selected_era}
 
 
-def _where(*conditions: str) -> str:
-    parts = [c for c in conditions if c]
-    return ("WHERE " + " AND ".join(parts)) if parts else ""
+def _where(*conditions: tuple[str, dict]) -> tuple[str, dict]:
+    parts = [sql for sql, _ in conditions if sql]
+    params = {k: v for _, p in conditions for k, v in p.items()}
+    return (("WHERE " + " AND ".join(parts)) if parts else ""), params
 
 
 # ── Header ──
@@ -150,35 +262,58 @@ tab_solar, tab_speed, tab_equity, tab_energy, tab_energy_solar, tab_targets = st
 # TAB 1: Solar Adoption
 # ══════════════════════════════════════════════════════════════
 with tab_solar:
-    w = _where(_year_filter())
-    solar = query(f"""
-        SELECT year, solar_count, cumulative_solar, total_valuation,
-               median_approval_days_nonzero, same_day_count
-        FROM '{_pq("solar_annual")}' {w}
-        ORDER BY year
-    """)
-
-    if len(solar) > 0:
-        latest = solar.iloc[-1]
-        total_solar = int(solar["solar_count"].sum())
-        cumulative = int(latest["cumulative_solar"])
-
-        # Growth rate — exclude current partial year
-        from datetime import date
-        current_year = date.today().year
-        full_years = solar[solar["year"] < current_year]
-        if len(full_years) >= 2:
-            prev = int(full_years.iloc[-2]["solar_count"])
-            curr = int(full_years.iloc[-1]["solar_count"])
-            growth_rate = ((curr - prev) / prev * 100) if prev else 0
-            growth_label = f"{int(full_years.iloc[-2]['year'])}-{int(full_years.iloc[-1]['year'])}"
-        else:
-            growth_rate = 0
-            growth_label = "YoY"
-
-        # Median from latest full year
-        _med_row = full_years.iloc[-1] if len(full_years) > 0 else latest
-        _med = _med_row["median_approval_days_nonzero"]
+    # facts_year spans every permit year; solar columns are NULL before the first solar permit
+    w, solar_params = _where(_year_filter(), ("solar_count IS NOT NULL", {}))
+    # Growth rate and median come from the latest *full* year
+    current_year = date.today().year
+    frames = qmany({
+        "solar": f"""
+            SELECT year, solar_count, cumulative_solar
+            FROM facts_year {w}
+            ORDER BY year
+        """,
+        "summary": (query_one, f"""
+            WITH s AS (
+                SELECT year, solar_count, cumulative_solar, median_approval_days_nonzero
+                FROM facts_year {w}
+            ),
+            latest AS (
+                SELECT * FROM s ORDER BY year DESC LIMIT 1
+            ),
+            last_full AS (
+                SELECT year, solar_count, median_approval_days_nonzero,
+                       LAG(year) OVER (ORDER BY year) AS prev_year,
+                       LAG(solar_count) OVER (ORDER BY year) AS prev_count
+                FROM s
+                WHERE year < {current_year}
+                ORDER BY year DESC
+                LIMIT 1
+            )
+            SELECT
+                (SELECT SUM(solar_count) FROM s)::BIGINT AS total_solar,
+                l.cumulative_solar AS cumulative,
+                CASE WHEN f.prev_year IS NULL OR f.prev_count = 0 THEN 0
+                     ELSE (f.solar_count - f.prev_count) * 100.0 / f.prev_count
+                END AS growth_rate,
+                CASE WHEN f.prev_year IS NULL THEN 'YoY'
+                     ELSE f.prev_year || '-' || f.year
+                END AS growth_label,
+                CASE WHEN f.year IS NULL THEN l.median_approval_days_nonzero
+                     ELSE f.median_approval_days_nonzero
+                END AS median_days
+            FROM latest l
+            LEFT JOIN last_full f ON TRUE
+        """),
+    }, solar_params, run=query_arrow)
+    solar = frames["solar"]
+
+    if solar.num_rows > 0:
+        summary = frames["summary"]
+        total_solar = int(summary["total_solar"])
+        cumulative = int(summary["cumulative"])
+        growth_rate = float(summary["growth_rate"])
+        growth_label = summary["growth_label"]
+        _med = summary["median_days"]
 
         col1, col2, col3, col4 = st.columns(4)
         col1.metric("Solar Permits (filtered)", f"{total_solar:,}")
@@ -189,20 +324,22 @@ with tab_solar:
 
         # Cumulative S-curve
         st.subheader("Cumulative Solar Installations (S-Curve)")
-        fig_cum = px.area(solar, x="year", y="cumulative_solar",
-                          labels={"year": "Year", "cumulative_solar": "Cumulative Permits"})
+        fig_cum = go.Figure(go.Scatter(
+            x=_col(solar, "year"), y=_col(solar, "cumulative_solar"), mode="lines", fill="tozeroy",
+            line_color=SOLAR_COLOR, fillcolor="rgba(255,184,0,0.3)",
+        ))
+        fig_cum.update_layout(xaxis_title="Year", yaxis_title="Cumulative Permits")
         fig_cum.add_vline(x=2015, line_dash="dash", line_color="red",
                           annotation_text="CAP Adopted", annotation_position="top left")
         fig_cum.add_vline(x=2017, line_dash="dash", line_color="orange",
                           annotation_text="Expedited Permitting", annotation_position="top right")
-        fig_cum.update_traces(fillcolor="rgba(255,184,0,0.3)", line_color=SOLAR_COLOR)
         st.plotly_chart(fig_cum, use_container_width=True)
 
         # Annual bar chart
         st.subheader("Annual Solar Permits")
-        fig_bar = px.bar(solar, x="year", y="solar_count",
-                         labels={"year": "Year", "solar_count": "Permits"})
-        fig_bar.update_traces(marker_color=SOLAR_COLOR)
+        fig_bar = go.Figure(go.Bar(x=_col(solar, "year"), y=_col(solar, "solar_count"),
+                                   marker_color=SOLAR_COLOR))
+        fig_bar.update_layout(xaxis_title="Year", yaxis_title="Permits")
         fig_bar.add_vline(x=2015, line_dash="dash", line_color="red")
         fig_bar.add_vline(x=2017, line_dash="dash", line_color="orange")
         st.plotly_chart(fig_bar, use_container_width=True)
@@ -216,14 +353,14 @@ with tab_solar:
 with tab_speed:
     # Policy era comparison
     st.subheader("Policy Era Comparison (Solar Permits)")
-    era_data = query(f"""
+    era_data = query("""
         SELECT
             policy_era,
             SUM(permit_count) AS total_permits,
             MEDIAN(median_days_nonzero) AS median_days,
             AVG(avg_days)::INTEGER AS avg_days,
             AVG(p90_days)::INTEGER AS p90_days
-        FROM '{_pq("approval_speed")}'
+        FROM approval_speed
         WHERE permit_category = 'Solar/PV' AND policy_era IS NOT NULL
         GROUP BY policy_era
         ORDER BY CASE policy_era
@@ -243,19 +380,19 @@ with tab_speed:
 
     # Median approval days trend by category
     st.subheader("Median Approval Days by Category")
-    w_speed = _where(_year_filter(), _cat_filter(), _era_filter())
-    speed = query(f"""
+    w_speed, speed_params = _where(_year_filter(), _cat_filter(), _era_filter())
+    speed = query_arrow(f"""
         SELECT year, permit_category,
-               SUM(permit_count) AS permit_count,
                MEDIAN(median_days_nonzero) AS median_days
-        FROM '{_pq("approval_speed")}' {w_speed}
+        FROM approval_speed {w_speed}
         GROUP BY year, permit_category
         ORDER BY year
-    """)
+    """, speed_params)
 
-    if len(speed) > 0:
-        fig_speed = px.line(speed, x="year", y="median_days", color="permit_category",
-                            labels={"year": "Year", "median_days": "Median Days", "permit_category": "Category"})
+    if speed.num_rows > 0:
+        fig_speed = _lines_by(go.Figure(), _col(speed, "year"), _col(speed, "median_days"),
+                              _col(speed, "permit_category"))
+        fig_speed.update_layout(xaxis_title="Year", yaxis_title="Median Days", legend_title_text="Category")
         fig_speed.add_vline(x=2015, line_dash="dash", line_color="red",
                             annotation_text="CAP", annotation_position="top left")
         fig_speed.add_vline(x=2017, line_dash="dash", line_color="orange",
@@ -264,17 +401,17 @@ with tab_speed:
 
     # P90 trend
     st.subheader("P90 Approval Days (Solar/PV)")
-    p90 = query(f"""
+    year_sql, year_params = _year_filter()
+    p90 = query_arrow(f"""
         SELECT year, MEDIAN(p90_days) AS p90_days
-        FROM '{_pq("approval_speed")}'
-        WHERE permit_category = 'Solar/PV' AND {_year_filter()}
+        FROM approval_speed
+        WHERE permit_category = 'Solar/PV' AND {year_sql}
         GROUP BY year
         ORDER BY year
-    """)
-    if len(p90) > 0:
-        fig_p90 = px.bar(p90, x="year", y="p90_days",
-                         labels={"year": "Year", "p90_days": "P90 Days"})
-        fig_p90.update_traces(marker_color=SOLAR_COLOR)
+    """, year_params)
+    if p90.num_rows > 0:
+        fig_p90 = go.Figure(go.Bar(x=_col(p90, "year"), y=_col(p90, "p90_days"), marker_color=SOLAR_COLOR))
+        fig_p90.update_layout(xaxis_title="Year", yaxis_title="P90 Days")
         st.plotly_chart(fig_p90, use_container_width=True)
 
 
@@ -282,52 +419,58 @@ with tab_speed:
 # TAB 3: Geographic Equity
 # ══════════════════════════════════════════════════════════════
 with tab_equity:
-    w_zip = _where(_year_filter())
+    w_zip, zip_params = _where(_year_filter())
 
     # Solar by zip (top 20)
     st.subheader("Top 20 Zip Codes by Solar Permits")
-    zip_solar = query(f"""
-        SELECT zip_code, SUM(solar_count) AS solar_count, SUM(total_valuation) AS total_valuation
-        FROM '{_pq("solar_by_zip")}' {w_zip}
+    zip_solar = query_arrow(f"""
+        SELECT CAST(zip_code AS VARCHAR) AS zip_code, SUM(solar_count)::BIGINT AS solar_count
+        FROM solar_by_zip {w_zip}
         GROUP BY zip_code
         ORDER BY solar_count DESC
         LIMIT 20
-    """)
-    if len(zip_solar) > 0:
-        zip_solar["zip_code"] = zip_solar["zip_code"].astype(str)
-        fig_zip = px.bar(zip_solar, x="solar_count", y="zip_code", orientation="h",
-                         labels={"solar_count": "Solar Permits", "zip_code": "Zip Code"})
-        fig_zip.update_traces(marker_color=SOLAR_COLOR)
-        fig_zip.update_layout(yaxis={"categoryorder": "total ascending", "type": "category"})
+    """, zip_params)
+    if zip_solar.num_rows > 0:
+        fig_zip = go.Figure(go.Bar(x=_col(zip_solar, "solar_count"), y=_col(zip_solar, "zip_code"),
+                                   orientation="h", marker_color=SOLAR_COLOR))
+        fig_zip.update_layout(xaxis_title="Solar Permits", yaxis_title="Zip Code",
+                              yaxis={"categoryorder": "total ascending", "type": "category"})
         st.plotly_chart(fig_zip, use_container_width=True)
 
     # Solar % by zip
     st.subheader("Solar as % of All Permits by Zip")
-    zip_pct = query(f"""
-        SELECT zip_code, solar_pct, solar_count, total_permits
-        FROM '{_pq("zip_code_summary")}'
+    zip_pct = query_arrow("""
+        SELECT CAST(zip_code AS VARCHAR) AS zip_code, solar_pct, solar_count, total_permits
+        FROM zip_code_summary
         WHERE solar_count > 0
         ORDER BY solar_pct DESC
         LIMIT 20
     """)
-    if len(zip_pct) > 0:
-        zip_pct["zip_code"] = zip_pct["zip_code"].astype(str)
-        fig_pct = px.bar(zip_pct, x="solar_pct", y="zip_code", orientation="h",
-                         labels={"solar_pct": "Solar %", "zip_code": "Zip Code"},
-                         hover_data=["solar_count", "total_permits"])
-        fig_pct.update_traces(marker_color=ELEC_COLOR)
-        fig_pct.update_layout(yaxis={"categoryorder": "total ascending", "type": "category"})
+    if zip_pct.num_rows > 0:
+        fig_pct = go.Figure(go.Bar(
+            x=_col(zip_pct, "solar_pct"), y=_col(zip_pct, "zip_code"), orientation="h",
+            marker_color=ELEC_COLOR,
+            customdata=list(zip(_col(zip_pct, "solar_count"), _col(zip_pct, "total_permits"))),
+            hovertemplate="Zip Code=%{y}<br>Solar %=%{x}<br>solar_count=%{customdata[0]}"
+                          "<br>total_permits=%{customdata[1]}<extra></extra>",
+        ))
+        fig_pct.update_layout(xaxis_title="Solar %", yaxis_title="Zip Code",
+                              yaxis={"categoryorder": "total ascending", "type": "category"})
         st.plotly_chart(fig_pct, use_container_width=True)
 
     # Map
     st.subheader("Solar Permit Locations")
+    # Seeded reservoir sample: one pass, no random sort, stable across reruns.
+    # USING SAMPLE applies before WHERE, so filter in a subquery first.
     map_df = query(f"""
-        SELECT lat, lng, valuation
-        FROM '{_pq("solar_map_points")}'
-        WHERE {_year_filter()}
-        ORDER BY RANDOM()
-        LIMIT 50000
-    """)
+        SELECT lat, lng
+        FROM (
+            SELECT lat, lng
+            FROM solar_map_points
+            {w_zip}
+        )
+        USING SAMPLE 50000 ROWS (reservoir, 42)
+    """, zip_params)
     if len(map_df) > 0:
         st.caption(f"{len(map_df):,} solar permits visualized")
         layer = pdk.Layer(
@@ -347,77 +490,71 @@ with tab_equity:
 # ══════════════════════════════════════════════════════════════
 with tab_energy:
     if _pq_exists("energy_trends"):
-        w_e = _where(_year_filter())
+        w_e, e_params = _where(_year_filter())
+
+        # One scan of energy_trends feeds the electricity, gas and per-customer charts
+        frames = qmany({
+            "trends": f"""
+                SELECT year || '-Q' || quarter AS period, customer_class,
+                       CASE customer_class WHEN 'R' THEN 'Residential' ELSE 'Commercial' END AS class_label,
+                       total_kwh, total_thm,
+                       (total_kwh / NULLIF(elec_customers, 0))::INTEGER AS kwh_per_customer
+                FROM energy_trends {w_e}
+                AND customer_class IN ('R', 'C')
+                ORDER BY year, quarter, customer_class
+            """,
+            "solar_annual": f"""
+                SELECT year, solar_count FROM facts_year {w_e}
+                AND solar_count IS NOT NULL
+                ORDER BY year
+            """,
+            "res_annual": f"""
+                SELECT year, residential_kwh AS total_kwh
+                FROM facts_year {w_e}
+                AND residential_kwh IS NOT NULL
+                ORDER BY year
+            """,
+        }, e_params, run=query_arrow)
+        trends = frames["trends"]
+        period, class_label = _col(trends, "period"), _col(trends, "class_label")
+        total_kwh, total_thm = _col(trends, "total_kwh"), _col(trends, "total_thm")
+        has_elec, has_gas = total_kwh > 0, total_thm > 0
+        per_cust = has_elec & (_col(trends, "customer_class") == "R")
+        solar_annual = frames["solar_annual"]
+        res_annual = frames["res_annual"]
 
         # Citywide electricity trends (residential vs commercial)
         st.subheader("Citywide Electricity Consumption (Quarterly)")
-        elec_trend = query(f"""
-            SELECT year, quarter, customer_class,
-                   total_kwh, elec_customers
-            FROM '{_pq("energy_trends")}' {w_e}
-            AND customer_class IN ('R', 'C') AND total_kwh > 0
-            ORDER BY year, quarter
-        """)
-        if len(elec_trend) > 0:
-            elec_trend["period"] = elec_trend["year"].astype(str) + "-Q" + elec_trend["quarter"].astype(str)
-            elec_trend["class_label"] = elec_trend["customer_class"].map({"R": "Residential", "C": "Commercial"})
-            fig_elec = px.line(elec_trend, x="period", y="total_kwh", color="class_label",
-                               labels={"period": "", "total_kwh": "Total kWh", "class_label": "Class"})
+        if has_elec.any():
+            fig_elec = _lines_by(go.Figure(), period[has_elec], total_kwh[has_elec], class_label[has_elec])
+            fig_elec.update_layout(yaxis_title="Total kWh", legend_title_text="Class")
             st.plotly_chart(fig_elec, use_container_width=True)
 
         # Gas trends
         st.subheader("Citywide Gas Consumption (Quarterly)")
-        gas_trend = query(f"""
-            SELECT year, quarter, customer_class,
-                   total_thm, gas_customers
-            FROM '{_pq("energy_trends")}' {w_e}
-            AND customer_class IN ('R', 'C') AND total_thm > 0
-            ORDER BY year, quarter
-        """)
-        if len(gas_trend) > 0:
-            gas_trend["period"] = gas_trend["year"].astype(str) + "-Q" + gas_trend["quarter"].astype(str)
-            gas_trend["class_label"] = gas_trend["customer_class"].map({"R": "Residential", "C": "Commercial"})
-            fig_gas = px.line(gas_trend, x="period", y="total_thm", color="class_label",
-                              labels={"period": "", "total_thm": "Total Therms", "class_label": "Class"})
+        if has_gas.any():
+            fig_gas = _lines_by(go.Figure(), period[has_gas], total_thm[has_gas], class_label[has_gas])
+            fig_gas.update_layout(yaxis_title="Total Therms", legend_title_text="Class")
             st.plotly_chart(fig_gas, use_container_width=True)
 
         # Energy per customer
         st.subheader("Average kWh per Residential Customer (Quarterly)")
-        per_cust = query(f"""
-            SELECT year, quarter,
-                   (total_kwh / NULLIF(elec_customers, 0))::INTEGER AS kwh_per_customer
-            FROM '{_pq("energy_trends")}' {w_e}
-            AND customer_class = 'R' AND total_kwh > 0
-            ORDER BY year, quarter
-        """)
-        if len(per_cust) > 0:
-            per_cust["period"] = per_cust["year"].astype(str) + "-Q" + per_cust["quarter"].astype(str)
-            fig_pc = px.line(per_cust, x="period", y="kwh_per_customer",
-                             labels={"period": "", "kwh_per_customer": "kWh per Customer"})
-            fig_pc.update_traces(line_color=ELEC_COLOR)
+        if per_cust.any():
+            fig_pc = go.Figure(go.Scatter(x=period[per_cust], y=_col(trends, "kwh_per_customer")[per_cust],
+                                          mode="lines", line_color=ELEC_COLOR))
+            fig_pc.update_layout(yaxis_title="kWh per Customer")
             st.plotly_chart(fig_pc, use_container_width=True)
 
         # Solar permits overlaid on energy chart
         st.subheader("Solar Permits vs Residential Electricity")
-        solar_annual = query(f"""
-            SELECT year, solar_count FROM '{_pq("solar_annual")}' {w_e}
-            ORDER BY year
-        """)
-        res_annual = query(f"""
-            SELECT year, SUM(total_kwh)::BIGINT AS total_kwh
-            FROM '{_pq("energy_trends")}' {w_e}
-            AND customer_class = 'R'
-            GROUP BY year
-            ORDER BY year
-        """)
-        if len(solar_annual) > 0 and len(res_annual) > 0:
+        if solar_annual.num_rows > 0 and res_annual.num_rows > 0:
             fig_dual = go.Figure()
             fig_dual.add_trace(go.Bar(
-                x=res_annual["year"], y=res_annual["total_kwh"],
+                x=_col(res_annual, "year"), y=_col(res_annual, "total_kwh"),
                 name="Residential kWh", marker_color=ELEC_COLOR, opacity=0.4, yaxis="y"
             ))
             fig_dual.add_trace(go.Scatter(
-                x=solar_annual["year"], y=solar_annual["solar_count"],
+                x=_col(solar_annual, "year"), y=_col(solar_annual, "solar_count"),
                 name="Solar Permits", line=dict(color=SOLAR_COLOR, width=3), yaxis="y2"
             ))
             fig_dual.update_layout(
@@ -439,38 +576,38 @@ with tab_energy_solar:
         st.caption("Do zip codes with more solar permits use less grid electricity?")
 
         # Join solar with energy by zip
+        w_s, s_params = _where(_year_filter())
         scatter = query(f"""
             WITH solar_totals AS (
                 SELECT zip_code, SUM(solar_count) AS solar_count
-                FROM '{_pq("solar_by_zip")}'
-                WHERE {_year_filter()}
+                FROM solar_by_zip {w_s}
                 GROUP BY zip_code
             ),
             energy_totals AS (
                 SELECT zip_code,
                        AVG(avg_kwh_per_customer)::INTEGER AS avg_kwh_per_customer,
                        SUM(total_kwh)::BIGINT AS total_kwh
-                FROM '{_pq("energy_by_zip_annual")}'
-                WHERE {_year_filter()}
+                FROM energy_by_zip_annual {w_s}
                 GROUP BY zip_code
             )
-            SELECT s.zip_code, s.solar_count,
+            SELECT CAST(s.zip_code AS VARCHAR) AS zip_code, s.solar_count,
                    e.avg_kwh_per_customer, e.total_kwh
             FROM solar_totals s
             JOIN energy_totals e ON s.zip_code = e.zip_code
             WHERE e.avg_kwh_per_customer IS NOT NULL AND e.avg_kwh_per_customer > 0
             ORDER BY s.solar_count DESC
-        """)
+        """, s_params)
 
         if len(scatter) > 0:
-            scatter["zip_code"] = scatter["zip_code"].astype(str)
-            fig_scatter = px.scatter(
-                scatter, x="solar_count", y="avg_kwh_per_customer",
-                hover_name="zip_code", size="total_kwh",
-                labels={"solar_count": "Solar Permits", "avg_kwh_per_customer": "Avg kWh/Customer"},
-                size_max=40,
-            )
-            fig_scatter.update_traces(marker_color=SOLAR_COLOR, marker_opacity=0.7)
+            size = scatter["total_kwh"].to_numpy()
+            fig_scatter = go.Figure(go.Scatter(
+                x=scatter["solar_count"].to_numpy(), y=scatter["avg_kwh_per_customer"].to_numpy(),
+                mode="markers", hovertext=scatter["zip_code"].to_numpy(),
+                # px.scatter's size_max=40 scaling
+                marker=dict(size=size, sizemode="area", sizeref=2.0 * size.max() / 40**2,
+                            color=SOLAR_COLOR, opacity=0.7),
+            ))
+            fig_scatter.update_layout(xaxis_title="Solar Permits", yaxis_title="Avg kWh/Customer")
             st.plotly_chart(fig_scatter, use_container_width=True)
 
             # Top vs bottom comparison
@@ -524,25 +661,60 @@ with tab_targets:
     st.subheader("Climate Action Plan Progress")
     st.caption("San Diego's CAP targets 100% clean/renewable electricity by 2035.")
 
-    # Solar milestone tracking
-    solar_all = query(f"""
-        SELECT year, solar_count, cumulative_solar
-        FROM '{_pq("solar_annual")}'
-        ORDER BY year
-    """)
-
-    if len(solar_all) > 0:
-        latest_year = int(solar_all.iloc[-1]["year"])
-        total_cum = int(solar_all.iloc[-1]["cumulative_solar"])
-
-        # Growth rate analysis
-        recent = solar_all[solar_all["year"] >= 2018]
-        if len(recent) >= 2:
-            avg_annual = int(recent["solar_count"].mean())
-            last_year_count = int(recent.iloc[-1]["solar_count"])
-        else:
-            avg_annual = 0
-            last_year_count = 0
+    # Every scalar on this tab, in one query (chart data is fetched separately)
+    frames = qmany({
+        "solar_all": """
+            SELECT year, solar_count
+            FROM facts_year
+            WHERE solar_count IS NOT NULL
+            ORDER BY year
+        """,
+        "numbers": (query_one, """
+            WITH solar AS (
+                SELECT year, solar_count, cumulative_solar
+                FROM facts_year
+                WHERE solar_count IS NOT NULL
+            ),
+            recent AS (
+                SELECT COUNT(*) AS n,
+                       FLOOR(AVG(solar_count))::BIGINT AS avg_annual,
+                       ARG_MAX(solar_count, year) AS last_year_count
+                FROM solar
+                WHERE year >= 2018
+            ),
+            eras AS (
+                SELECT policy_era,
+                       SUM(permit_count)::BIGINT AS total,
+                       COALESCE(MEDIAN(median_days_nonzero), 0) AS median_days
+                FROM approval_speed
+                WHERE permit_category = 'Solar/PV' AND policy_era IS NOT NULL
+                GROUP BY policy_era
+            ),
+            pct AS (
+                SELECT ROUND(SUM(CASE WHEN is_solar THEN 1 ELSE 0 END) * 100.0 / COUNT(*), 1) AS solar_pct
+                FROM climate_permits
+            )
+            SELECT
+                (SELECT MAX(year) FROM solar) AS latest_year,
+                (SELECT ARG_MAX(cumulative_solar, year) FROM solar)::BIGINT AS total_cum,
+                CASE WHEN r.n >= 2 THEN r.avg_annual ELSE 0 END AS avg_annual,
+                CASE WHEN r.n >= 2 THEN r.last_year_count ELSE 0 END AS last_year_count,
+                (SELECT total FROM eras WHERE policy_era = 'Pre-CAP') AS pre_count,
+                (SELECT median_days FROM eras WHERE policy_era = 'Pre-CAP') AS pre_days,
+                (SELECT total FROM eras WHERE policy_era = 'Expedited Era') AS exp_count,
+                (SELECT median_days FROM eras WHERE policy_era = 'Expedited Era') AS exp_days,
+                (SELECT solar_pct FROM pct) AS solar_pct
+            FROM recent r
+        """),
+    }, run=query_arrow)
+    solar_all = frames["solar_all"]
+    numbers = frames["numbers"]
+
+    if solar_all.num_rows > 0:
+        latest_year = numbers["latest_year"]
+        total_cum = numbers["total_cum"]
+        avg_annual = numbers["avg_annual"]
+        last_year_count = numbers["last_year_count"]
 
         col1, col2, col3 = st.columns(3)
         col1.metric("Total Solar Installations", f"{total_cum:,}")
@@ -551,9 +723,9 @@ with tab_targets:
 
         # Solar trajectory
         st.subheader("Solar Installation Trajectory")
-        fig_traj = px.bar(solar_all, x="year", y="solar_count",
-                          labels={"year": "Year", "solar_count": "Annual Permits"})
-        fig_traj.update_traces(marker_color=SOLAR_COLOR)
+        fig_traj = go.Figure(go.Bar(x=_col(solar_all, "year"), y=_col(solar_all, "solar_count"),
+                                    marker_color=SOLAR_COLOR))
+        fig_traj.update_layout(xaxis_title="Year", yaxis_title="Annual Permits")
         # Target line (if we need X per year to hit target)
         fig_traj.add_hline(y=avg_annual, line_dash="dot", line_color="green",
                            annotation_text=f"Avg ({avg_annual:,}/yr)")
@@ -561,18 +733,19 @@ with tab_targets:
 
     # Energy permits breakdown
     st.subheader("Climate-Relevant Permits by Type")
-    energy_permits = query(f"""
-        SELECT year, solar_count, electrical_count, mechanical_count
-        FROM '{_pq("energy_permits_annual")}'
+    energy_permits = query_arrow("""
+        SELECT year, COALESCE(solar_count, 0) AS solar_count, electrical_count, mechanical_count
+        FROM facts_year
         ORDER BY year
     """)
-    if len(energy_permits) > 0:
+    if energy_permits.num_rows > 0:
+        ep_year = _col(energy_permits, "year")
         fig_ep = go.Figure()
-        fig_ep.add_trace(go.Bar(x=energy_permits["year"], y=energy_permits["solar_count"],
+        fig_ep.add_trace(go.Bar(x=ep_year, y=_col(energy_permits, "solar_count"),
                                 name="Solar/PV", marker_color=SOLAR_COLOR))
-        fig_ep.add_trace(go.Bar(x=energy_permits["year"], y=energy_permits["electrical_count"],
+        fig_ep.add_trace(go.Bar(x=ep_year, y=_col(energy_permits, "electrical_count"),
                                 name="Electrical", marker_color=ELEC_COLOR))
-        fig_ep.add_trace(go.Bar(x=energy_permits["year"], y=energy_permits["mechanical_count"],
+        fig_ep.add_trace(go.Bar(x=ep_year, y=_col(energy_permits, "mechanical_count"),
                                 name="Mechanical/HVAC", marker_color=MECH_COLOR))
         fig_ep.update_layout(barmode="stack", legend=dict(x=0, y=1.1, orientation="h"))
         st.plotly_chart(fig_ep, use_container_width=True)
@@ -580,45 +753,28 @@ with tab_targets:
     # Energy consumption trajectory
     if _pq_exists("energy_trends"):
         st.subheader("Residential Electricity Consumption Trajectory")
-        res_trend = query(f"""
-            SELECT year, SUM(total_kwh)::BIGINT AS total_kwh
-            FROM '{_pq("energy_trends")}'
-            WHERE customer_class = 'R'
-            GROUP BY year
+        res_trend = query_arrow("""
+            SELECT year, residential_kwh AS total_kwh
+            FROM facts_year
+            WHERE residential_kwh IS NOT NULL
             ORDER BY year
         """)
-        if len(res_trend) > 0:
-            fig_res = px.line(res_trend, x="year", y="total_kwh",
-                              labels={"year": "Year", "total_kwh": "Total Residential kWh"})
-            fig_res.update_traces(line_color=ELEC_COLOR, line_width=3)
+        if res_trend.num_rows > 0:
+            fig_res = go.Figure(go.Scatter(x=_col(res_trend, "year"), y=_col(res_trend, "total_kwh"),
+                                           mode="lines", line=dict(color=ELEC_COLOR, width=3)))
+            fig_res.update_layout(xaxis_title="Year", yaxis_title="Total Residential kWh")
             st.plotly_chart(fig_res, use_container_width=True)
 
     # By-the-numbers narrative
     st.subheader("By the Numbers")
-    era_compare = query(f"""
-        SELECT policy_era,
-               SUM(permit_count) AS total,
-               MEDIAN(median_days_nonzero) AS median_days
-        FROM '{_pq("approval_speed")}'
-        WHERE permit_category = 'Solar/PV' AND policy_era IS NOT NULL
-        GROUP BY policy_era
-    """)
-    if len(era_compare) > 0:
-        pre_cap = era_compare[era_compare["policy_era"] == "Pre-CAP"]
-        expedited = era_compare[era_compare["policy_era"] == "Expedited Era"]
-
-        if len(pre_cap) > 0 and len(expedited) > 0:
-            pre_days = float(pre_cap.iloc[0]["median_days"]) if pre_cap.iloc[0]["median_days"] else 0
-            exp_days = float(expedited.iloc[0]["median_days"]) if expedited.iloc[0]["median_days"] else 0
-            pre_count = int(pre_cap.iloc[0]["total"])
-            exp_count = int(expedited.iloc[0]["total"])
-
-            if pre_days > 0 and exp_days > 0:
-                speed_improvement = ((pre_days - exp_days) / pre_days * 100)
-                st.markdown(f"""
-                - **{total_cum:,}** total solar installations across San Diego
-                - **{speed_improvement:.0f}%** faster solar permit approval in the Expedited Era
-                  ({exp_days:.0f} days vs {pre_days:.0f} days median)
-                - **{exp_count:,}** solar permits in the Expedited Era vs **{pre_count:,}** Pre-CAP
-                - Solar permits represent **{float(query(f"SELECT ROUND(SUM(CASE WHEN is_solar THEN 1 ELSE 0 END) * 100.0 / COUNT(*), 1) AS pct FROM '{_PROCESSED}/climate_permits.parquet'").iloc[0][0]):.1f}%** of all development permits
-                """)
+    pre_days, exp_days = numbers["pre_days"], numbers["exp_days"]
+    if numbers["pre_count"] is not None and numbers["exp_count"] is not None:
+        if pre_days > 0 and exp_days > 0:
+            speed_improvement = ((pre_days - exp_days) / pre_days * 100)
+            st.markdown(f"""
+            - **{total_cum:,}** total solar installations across San Diego
+            - **{speed_improvement:.0f}%** faster solar permit approval in the Expedited Era
+              ({exp_days:.0f} days vs {pre_days:.0f} days median)
+            - **{numbers["exp_count"]:,}** solar permits in the Expedited Era vs **{numbers["pre_count"]:,}** Pre-CAP
+            - Solar permits represent **{numbers["solar_pct"]:.1f}%** of all development permits
+            """)
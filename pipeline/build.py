@@ -1,18 +1,23 @@
-"""Orchestrator: ingest then transform."""
+"""Orchestrator: ingest then transform.
+
+The SDG&E download (many small files) runs in a background thread while
+the permit transform runs, since only the energy step needs those files.
+"""
 
 from __future__ import annotations
 
 import argparse
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-from pipeline.ingest import ingest
+from pipeline.ingest import STREAM, ingest_permits, ingest_sdge
 from pipeline.transform import transform
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Build climate action data pipeline")
     parser.add_argument(
-        "--force", action="store_true", help="Re-download all source files"
+        "--force", action="store_true", help="Re-download all source files and rebuild every transform stage"
     )
     args = parser.parse_args()
 
@@ -20,12 +25,21 @@ def main() -> None:
 
     print("=== Climate Action Pipeline ===")
     print()
-    print("Step 1/2: Ingest")
-    ingest(force=args.force)
-
-    print()
-    print("Step 2/2: Transform")
-    transform()
+    if STREAM:
+        print("Step 1/2: Ingest (skipped, PIPELINE_STREAM=1 reads sources over HTTP)")
+        print()
+        print("Step 2/2: Transform")
+        transform(force=args.force)
+    else:
+        print("Step 1/2: Ingest")
+        ingest_permits(force=args.force)
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            sdge = pool.submit(ingest_sdge, force=args.force)
+
+            print()
+            print("Step 2/2: Transform (SDG&E download continues in background)")
+            transform(wait_for_energy=sdge.result, force=args.force)
 
     elapsed = time.perf_counter() - t0
     print(f"\nPipeline complete in {elapsed:.1f}s")
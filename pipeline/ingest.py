@@ -2,7 +2,11 @@
 
 from __future__ import annotations
 
+import asyncio
+import json
+import os
 from datetime import date
+from functools import partial
 from pathlib import Path
 
 import httpx
@@ -10,6 +14,12 @@ import httpx
 _ROOT = Path(__file__).resolve().parent.parent
 RAW_DIR = _ROOT / "data" / "raw"
 SDGE_DIR = RAW_DIR / "sdge"
+# {name: {"etag": ..., "last_modified": ...}} from the last successful download
+ETAGS = RAW_DIR / "_etags.json"
+
+# PIPELINE_STREAM=1: skip downloading and let the transform read the source
+# CSVs straight from their URLs (DuckDB httpfs) instead of data/raw copies.
+STREAM = os.getenv("PIPELINE_STREAM") == "1"
 
 # ── Permit sources (same as sd-housing-permits) ──
 
@@ -26,6 +36,25 @@ PERMIT_SOURCES: dict[str, str] = {
 SDGE_BASE = "https://energydata.sdge.com/downloadEnergyUsageFile?name="
 SDGE_START_YEAR = 2012
 SDGE_START_QUARTER = 1
+# Quarters that probed as 403/404, so later runs don't ask again
+SDGE_MISSING = SDGE_DIR / "_missing.json"
+# File name -> size of every SDG&E file on disk, so the transform can list
+# them without globbing and stat-ing the directory
+SDGE_MANIFEST = SDGE_DIR / "_manifest.json"
+
+# ── HTTP ──
+# One AsyncClient (and connection pool) is shared by every download in a run;
+# the semaphore bounds how many transfers are in flight at once.
+
+MAX_CONCURRENT_DOWNLOADS = 8
+
+
+def _client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        follow_redirects=True,
+        timeout=300,
+        limits=httpx.Limits(max_connections=16, max_keepalive_connections=16),
+    )
 
 
 def _sdge_urls() -> list[tuple[str, str]]:
@@ -45,21 +74,122 @@ def _sdge_urls() -> list[tuple[str, str]]:
     return pairs
 
 
-def _download(name: str, url: str, dest: Path, *, force: bool = False) -> Path | None:
-    """Download a single file. Skips if exists and force=False."""
-    if dest.exists() and not force:
-        print(f"  [skip] {name} ({dest.stat().st_size:,} bytes)")
-        return dest
+def _load_missing() -> set[str]:
+    if not SDGE_MISSING.exists():
+        return set()
+    return set(json.loads(SDGE_MISSING.read_text()))
+
+
+def _save_missing(names: set[str]) -> None:
+    """Persist missing quarters, except recent ones that may still be published."""
+    cutoff = date.today().year - 1
+    settled = sorted(n for n in names if int(n.split("-")[2]) < cutoff)
+    SDGE_DIR.mkdir(parents=True, exist_ok=True)
+    SDGE_MISSING.write_text(json.dumps(settled, indent=1))
+
+
+def _save_manifest(sizes: dict[str, int], *, fetched: bool) -> None:
+    """Write the SDG&E manifest if it changed or any file body was fetched.
+
+    The transform fingerprints the manifest to decide whether the energy
+    stage must rerun, so a run that only skipped files (or got 304s) must
+    leave its mtime alone.
+    """
+    text = json.dumps(sizes, indent=1, sort_keys=True)
+    if not fetched and SDGE_MANIFEST.exists() and SDGE_MANIFEST.read_text() == text:
+        return
+    tmp = SDGE_MANIFEST.with_suffix(".tmp")
+    tmp.write_text(text)
+    tmp.replace(SDGE_MANIFEST)
+
+
+def _load_etags() -> dict[str, dict[str, str]]:
+    if not ETAGS.exists():
+        return {}
+    return json.loads(ETAGS.read_text())
+
 
+def _save_etags(etags: dict[str, dict[str, str]]) -> None:
+    """Write the manifest via a temp file + rename so it's never half-written."""
+    RAW_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = ETAGS.with_suffix(".tmp")
+    tmp.write_text(json.dumps(etags, indent=1, sort_keys=True))
+    tmp.replace(ETAGS)
+
+
+def _conditional_headers(validators: dict[str, str] | None) -> dict[str, str]:
+    if not validators:
+        return {}
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+async def _probe(client: httpx.AsyncClient, sem: asyncio.Semaphore, url: str) -> int:
+    """HEAD a URL and return its status code."""
+    async with sem:
+        r = await client.head(url)
+        return r.status_code
+
+
+async def _probe_missing(
+    client: httpx.AsyncClient, sem: asyncio.Semaphore, pairs: list[tuple[str, str]]
+) -> set[str]:
+    """HEAD-probe (name, url) pairs; returns the names answering 403/404.
+
+    Anything else (e.g. 405 if HEAD isn't allowed) is treated as live.
+    """
+    statuses = await asyncio.gather(*(_probe(client, sem, url) for _, url in pairs))
+    return {name for (name, _), status in zip(pairs, statuses) if status in (403, 404)}
+
+
+async def _download(
+    client: httpx.AsyncClient,
+    name: str,
+    url: str,
+    dest: Path,
+    etags: dict[str, dict[str, str]],
+    *,
+    force: bool = False,
+) -> int | None:
+    """Download a single file; returns its size in bytes, or None if unpublished.
+
+    Skips if exists and force=False. With force=True an existing file is
+    revalidated with its stored ETag/Last-Modified, so an unchanged file
+    costs a 304 instead of a body. The size comes from one stat of an
+    existing file or from counting the bytes written.
+    """
+    try:
+        existing = dest.stat().st_size
+    except FileNotFoundError:
+        existing = None
+    if existing is not None and not force:
+        print(f"  [skip] {name} ({existing:,} bytes)")
+        return existing
+
+    headers = _conditional_headers(etags.get(name)) if existing is not None else {}
     print(f"  [download] {name} ...")
     try:
-        with httpx.stream("GET", url, follow_redirects=True, timeout=300) as r:
+        async with client.stream("GET", url, headers=headers) as r:
+            if r.status_code == 304:
+                print(f"  [unchanged] {name} ({existing:,} bytes)")
+                return existing
             r.raise_for_status()
+            size = 0
             with open(dest, "wb") as f:
-                for chunk in r.iter_bytes(chunk_size=1 << 20):
-                    f.write(chunk)
-        print(f"  [done] {name} -> {dest.stat().st_size:,} bytes")
-        return dest
+                async for chunk in r.aiter_bytes(chunk_size=1 << 20):
+                    # Disk writes go to a thread so they don't stall other transfers
+                    await asyncio.to_thread(f.write, chunk)
+                    size += len(chunk)
+            etags[name] = {
+                "etag": r.headers.get("etag", ""),
+                "last_modified": r.headers.get("last-modified", ""),
+            }
+        print(f"  [done] {name} -> {size:,} bytes")
+        return size
     except httpx.HTTPStatusError as e:
         if e.response.status_code in (403, 404):
             print(f"  [warn] {name}: {e.response.status_code}, skipping")
@@ -67,26 +197,103 @@ def _download(name: str, url: str, dest: Path, *, force: bool = False) -> Path |
         raise
 
 
-def ingest(*, force: bool = False) -> None:
-    """Download all source data: permits + SDG&E energy files."""
-    RAW_DIR.mkdir(parents=True, exist_ok=True)
-    SDGE_DIR.mkdir(parents=True, exist_ok=True)
+async def _download_all(
+    client: httpx.AsyncClient,
+    sem: asyncio.Semaphore,
+    jobs: list[tuple[str, str, Path]],
+    etags: dict[str, dict[str, str]],
+    *,
+    force: bool = False,
+) -> list[int | None]:
+    """Download (name, url, dest) jobs concurrently; results (sizes) keep job order."""
+
+    async def one(name: str, url: str, dest: Path) -> int | None:
+        async with sem:
+            return await _download(client, name, url, dest, etags, force=force)
 
-    # Permits
+    return await asyncio.gather(*(one(*job) for job in jobs))
+
+
+async def _ingest_permits(
+    client: httpx.AsyncClient, sem: asyncio.Semaphore, etags: dict, *, force: bool
+) -> None:
+    RAW_DIR.mkdir(parents=True, exist_ok=True)
     print("Downloading permit CSVs ...")
-    for name, url in PERMIT_SOURCES.items():
-        _download(name, url, RAW_DIR / f"{name}.csv", force=force)
+    jobs = [(name, url, RAW_DIR / f"{name}.csv") for name, url in PERMIT_SOURCES.items()]
+    await _download_all(client, sem, jobs, etags, force=force)
 
-    # SDG&E energy
+
+async def _ingest_sdge(
+    client: httpx.AsyncClient, sem: asyncio.Semaphore, etags: dict, *, force: bool
+) -> None:
+    SDGE_DIR.mkdir(parents=True, exist_ok=True)
     print("Downloading SDG&E energy data ...")
     pairs = _sdge_urls()
-    print(f"  {len(pairs)} quarterly files to check ...")
-    downloaded = 0
-    for name, url in pairs:
-        result = _download(name, url, SDGE_DIR / f"{name}.csv", force=force)
-        if result:
-            downloaded += 1
-    print(f"  SDG&E: {downloaded}/{len(pairs)} files available")
+    known_missing = set() if force else _load_missing()
+    print(f"  {len(pairs)} quarterly files to check ({len(known_missing)} known missing) ...")
+    pairs = [(name, url) for name, url in pairs if name not in known_missing]
+
+    # HEAD-probe files we'd fetch, so unpublished quarters cost no GET
+    to_fetch = [(name, url) for name, url in pairs if force or not (SDGE_DIR / f"{name}.csv").exists()]
+    missing = await _probe_missing(client, sem, to_fetch)
+    if missing:
+        print(f"  {len(missing)} quarters not published, skipping")
+
+    jobs = [(name, url, SDGE_DIR / f"{name}.csv") for name, url in pairs if name not in missing]
+    # _download replaces a file's validators entry only when it fetched a body
+    validators = {name: etags.get(name) for name, _, _ in jobs}
+    results = await _download_all(client, sem, jobs, etags, force=force)
+    fetched = any(etags.get(name) is not v for name, v in validators.items())
+    downloaded = sum(1 for r in results if r is not None)
+    missing |= {name for (name, _, _), r in zip(jobs, results) if r is None}
+    _save_missing(known_missing | missing)
+    _save_manifest(
+        {dest.name: r for (_, _, dest), r in zip(jobs, results) if r is not None}, fetched=fetched
+    )
+    print(f"  SDG&E: {downloaded}/{len(pairs) + len(known_missing)} files available")
+
+
+async def _ingest(*steps) -> None:
+    """Run ingest steps concurrently over one shared client and ETag manifest."""
+    sem = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    etags = _load_etags()
+    try:
+        async with _client() as client:
+            await asyncio.gather(*(step(client, sem, etags) for step in steps))
+    finally:
+        _save_etags(etags)
+
+
+def sdge_published_urls() -> list[str]:
+    """URLs of the SDG&E files currently published, for reading them in place.
+
+    Probes every quarter not already known to be missing (no downloads).
+    """
+
+    async def run() -> list[tuple[str, str]]:
+        known_missing = _load_missing()
+        pairs = [(name, url) for name, url in _sdge_urls() if name not in known_missing]
+        async with _client() as client:
+            missing = await _probe_missing(client, asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS), pairs)
+        _save_missing(known_missing | missing)
+        return [(name, url) for name, url in pairs if name not in missing]
+
+    return [url for _, url in asyncio.run(run())]
+
+
+def ingest_permits(*, force: bool = False) -> None:
+    """Download the permit CSVs."""
+    asyncio.run(_ingest(partial(_ingest_permits, force=force)))
+
+
+def ingest_sdge(*, force: bool = False) -> None:
+    """Download the SDG&E quarterly energy files."""
+    asyncio.run(_ingest(partial(_ingest_sdge, force=force)))
+
+
+def ingest(*, force: bool = False) -> None:
+    """Download all source data: permits + SDG&E energy files."""
+    asyncio.run(_ingest(partial(_ingest_permits, force=force), partial(_ingest_sdge, force=force)))
 
 
 if __name__ == "__main__":
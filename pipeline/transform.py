@@ -2,60 +2,134 @@
 
 from __future__ import annotations
 
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Callable
 
 import duckdb
 
+from pipeline.ingest import PERMIT_SOURCES, SDGE_MANIFEST, STREAM, sdge_published_urls
+
 _ROOT = Path(__file__).resolve().parent.parent
 _RAW = _ROOT / "data" / "raw"
 _SDGE = _RAW / "sdge"
 _PROCESSED = _ROOT / "data" / "processed"
 _AGG = _ROOT / "data" / "aggregated"
 
-# Raw permit CSVs
-_SET1_ACTIVE = str(_RAW / "set1_active.csv")
-_SET1_CLOSED = str(_RAW / "set1_closed.csv")
-_SET2_ACTIVE = str(_RAW / "set2_active.csv")
-_SET2_CLOSED = str(_RAW / "set2_closed.csv")
+# Options for every parquet COPY. DuckDB dictionary-encodes low-cardinality
+# strings (zip_code, permit_category, policy_era, customer_class) by default.
+# ZSTD level 1: the cheapest ZSTD write; Snappy writes a little faster still
+# but its files were ~30-60% larger for the same read speed.
+_PARQUET_OPTS = "FORMAT PARQUET, CODEC 'ZSTD', COMPRESSION_LEVEL 1, ROW_GROUP_SIZE 100000"
+
+# Per-source row counts are logging only; each one is an extra query, so
+# they print only with PIPELINE_VERBOSE=1
+_VERBOSE = os.getenv("PIPELINE_VERBOSE") == "1"
 
 _PERMITS_PARQUET = str(_PROCESSED / "climate_permits.parquet")
 _ENERGY_PARQUET = str(_PROCESSED / "energy_consumption.parquet")
 
 
-def transform() -> None:
-    """Run the full transform pipeline."""
+def _permit_csvs(*names: str) -> str:
+    """SQL list literal of permit CSVs: raw files, or upstream URLs when streaming."""
+    paths = [PERMIT_SOURCES[name] if STREAM else str(_RAW / f"{name}.csv") for name in names]
+    return "[" + ", ".join(f"'{p}'" for p in paths) + "]"
+
+
+def _stage_digest(paths: list[Path]) -> str:
+    """Fingerprint a stage's inputs (path, mtime, size) plus this module's source."""
+    h = hashlib.blake2b(digest_size=16)
+    for p in [*paths, Path(__file__)]:
+        st = p.stat()
+        h.update(f"{p}:{st.st_mtime_ns}:{st.st_size}\n".encode())
+    return h.hexdigest()
+
+
+def _stage_is_current(stage: str, digest: str | None, output: str | Path) -> bool:
+    """True if ``stage`` last ran on identical inputs and its output still exists."""
+    sidecar = _PROCESSED / f".{stage}.digest"
+    return (
+        digest is not None
+        and Path(output).exists()
+        and sidecar.exists()
+        and sidecar.read_text() == digest
+    )
+
+
+def _save_stage_digest(stage: str, digest: str | None) -> None:
+    if digest is not None:
+        (_PROCESSED / f".{stage}.digest").write_text(digest)
+
+
+def transform(wait_for_energy: Callable[[], None] | None = None, force: bool = False) -> None:
+    """Run the full transform pipeline.
+
+    The permit and energy transforms share nothing, so they run concurrently
+    on two cursors of one in-memory database (the aggregations then read both
+    tables). ``wait_for_energy`` is called on the energy side before the
+    SDG&E files are read, so the caller can still be downloading them while
+    permits are processed.
+
+    Each stage records a digest of its inputs in ``data/processed/.<stage>.digest``
+    and is skipped when they are unchanged, unless ``force``; a skipped stage's
+    table is re-exposed as a view over its parquet. Streamed CSVs have no local
+    files to fingerprint, so those stages always run.
+    """
     _PROCESSED.mkdir(parents=True, exist_ok=True)
     _AGG.mkdir(parents=True, exist_ok=True)
 
     con = duckdb.connect()
+    # Threads default to every core; PIPELINE_THREADS / PIPELINE_MEMORY_LIMIT
+    # cap them on shared machines. Insertion order isn't needed (every output
+    # is written with an explicit ORDER BY), which lets operators run freely
+    # in parallel; the object cache keeps parquet footers between reads.
+    con.execute(f"SET threads = {int(os.getenv('PIPELINE_THREADS') or os.cpu_count() or 1)}")
+    if os.getenv("PIPELINE_MEMORY_LIMIT"):
+        con.execute(f"SET memory_limit = '{os.environ['PIPELINE_MEMORY_LIMIT']}'")
+    con.execute("SET preserve_insertion_order = false")
+    con.execute("SET enable_object_cache = true")
+    if STREAM:
+        # Keep-alive reuses connections across the many SDG&E files (each
+        # fuel's URLs go to one read_csv call); the metadata cache saves
+        # repeat HEADs when a file is scanned again for sniffing.
+        con.execute("""
+            INSTALL httpfs;
+            LOAD httpfs;
+            SET http_keep_alive = true;
+            SET http_retries = 3;
+            SET http_timeout = 300;
+            SET enable_http_metadata_cache = true;
+        """)
 
-    _transform_permits(con)
-    _transform_energy(con)
-    _build_aggregations(con)
+    def energy_stage(cur: duckdb.DuckDBPyConnection) -> None:
+        if wait_for_energy is not None:
+            wait_for_energy()
+        _transform_energy(cur, force)
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        energy = pool.submit(energy_stage, con.cursor())
+        _transform_permits(con, force)
+        energy.result()
+    _build_aggregations(con, force)
 
     con.close()
     print("  Transform complete.")
 
 
-def _transform_permits(con: duckdb.DuckDBPyConnection) -> None:
-    """Load, normalize, and export climate-focused permit data."""
+def _permit_set_view(con: duckdb.DuckDBPyConnection, name: str, csvs: str, source_system: str) -> None:
+    """Define view ``name`` over one permit system's CSVs, projected in a single pass.
 
-    # ── Load Set 1 (legacy system) ──
-    print("  Loading Set 1 (legacy) ...")
+    Selecting the needed columns straight from read_csv lets DuckDB skip
+    parsing the rest; as a view, nothing is materialized until ``permits``.
+    The San Diego bbox sanity check runs here too, so out-of-bounds rows never
+    reach the union, the derived columns, or the dedup window.
+    """
     con.execute(f"""
-        CREATE OR REPLACE TABLE set1_raw AS
-        SELECT * FROM read_csv(
-            ['{_SET1_ACTIVE}', '{_SET1_CLOSED}'],
-            union_by_name = true,
-            auto_detect = true,
-            ignore_errors = true
-        )
-    """)
-    row_count_1 = con.execute("SELECT COUNT(*) FROM set1_raw").fetchone()[0]
-    print(f"    Set 1 rows: {row_count_1:,}")
-
-    con.execute("""
-        CREATE OR REPLACE TABLE set1 AS
+        CREATE OR REPLACE VIEW {name} AS
         SELECT
             CAST(APPROVAL_ID AS VARCHAR)        AS approval_id,
             CAST(PROJECT_ID AS VARCHAR)         AS project_id,
@@ -71,68 +145,73 @@ def _transform_permits(con: duckdb.DuckDBPyConnection) -> None:
             TRY_CAST(DATE_APPROVAL_EXPIRE AS DATE)  AS date_approval_expire,
             TRY_CAST(DATE_APPROVAL_CLOSE AS DATE)   AS date_approval_close,
             TRY_CAST(APPROVAL_VALUATION AS DOUBLE)  AS valuation,
-            'legacy'                            AS source_system
-        FROM set1_raw
-    """)
-
-    # ── Load Set 2 (current system) ──
-    print("  Loading Set 2 (current) ...")
-    con.execute(f"""
-        CREATE OR REPLACE TABLE set2_raw AS
-        SELECT * FROM read_csv(
-            ['{_SET2_ACTIVE}', '{_SET2_CLOSED}'],
+            '{source_system}'                   AS source_system
+        FROM read_csv(
+            {csvs},
             union_by_name = true,
             auto_detect = true,
             ignore_errors = true
         )
+        WHERE (lat IS NULL OR lat BETWEEN 32.5 AND 33.3)
+          AND (lng IS NULL OR lng BETWEEN -117.7 AND -116.8)
     """)
-    row_count_2 = con.execute("SELECT COUNT(*) FROM set2_raw").fetchone()[0]
-    print(f"    Set 2 rows: {row_count_2:,}")
 
+
+def _transform_permits(con: duckdb.DuckDBPyConnection, force: bool = False) -> None:
+    """Load, normalize, and export climate-focused permit data."""
+
+    # Fixed label sets as ENUMs: stored and grouped as small integer codes,
+    # ordered as declared (eras chronologically), written to parquet as strings
     con.execute("""
-        CREATE OR REPLACE TABLE set2 AS
-        SELECT
-            CAST(APPROVAL_ID AS VARCHAR)        AS approval_id,
-            CAST(PROJECT_ID AS VARCHAR)         AS project_id,
-            CAST(JOB_ID AS VARCHAR)             AS job_id,
-            TRIM(ADDRESS_JOB)                   AS address,
-            TRIM(CAST(JOB_APN AS VARCHAR))      AS apn,
-            TRY_CAST(LAT_JOB AS DOUBLE)         AS lat,
-            TRY_CAST(LNG_JOB AS DOUBLE)         AS lng,
-            TRIM(APPROVAL_TYPE)                 AS approval_type,
-            TRIM(APPROVAL_STATUS)               AS approval_status,
-            TRY_CAST(DATE_APPROVAL_CREATE AS DATE)  AS date_approval_create,
-            TRY_CAST(DATE_APPROVAL_ISSUE AS DATE)   AS date_approval_issue,
-            TRY_CAST(DATE_APPROVAL_EXPIRE AS DATE)  AS date_approval_expire,
-            TRY_CAST(DATE_APPROVAL_CLOSE AS DATE)   AS date_approval_close,
-            TRY_CAST(APPROVAL_VALUATION AS DOUBLE)  AS valuation,
-            'current'                           AS source_system
-        FROM set2_raw
+        CREATE TYPE permit_category_t AS ENUM ('Solar/PV', 'Electrical', 'Mechanical/HVAC', 'Building', 'Other');
+        CREATE TYPE policy_era_t AS ENUM ('Pre-CAP', 'CAP Adopted', 'Expedited Era');
     """)
 
-    # ── Union + derive climate fields ──
-    print("  Unioning sets + deriving climate fields ...")
+    csvs = [_RAW / f"{name}.csv" for name in ("set1_active", "set1_closed", "set2_active", "set2_closed")]
+    digest = None if STREAM else _stage_digest(csvs)
+    if not force and _stage_is_current("permits", digest, _PERMITS_PARQUET):
+        # parquet stores the ENUMs as strings; cast back so aggregations sort the same
+        print("  Permit CSVs unchanged, reusing climate_permits.parquet")
+        con.execute(f"""
+            CREATE OR REPLACE VIEW permits AS
+            SELECT * REPLACE (
+                permit_category::permit_category_t AS permit_category,
+                policy_era::policy_era_t AS policy_era
+            )
+            FROM read_parquet('{_PERMITS_PARQUET}')
+        """)
+        return
+
+    # ── Set 1 (legacy) + Set 2 (current) ──
+    # Views, so the CSV scans, union and derivation below run as one
+    # pipeline and only the final `permits` table is materialized.
+    _permit_set_view(con, "set1", _permit_csvs("set1_active", "set1_closed"), "legacy")
+    _permit_set_view(con, "set2", _permit_csvs("set2_active", "set2_closed"), "current")
     con.execute("""
-        CREATE OR REPLACE TABLE permits_union AS
+        CREATE OR REPLACE VIEW permits_union AS
         SELECT * FROM set1
         UNION ALL
         SELECT * FROM set2
     """)
 
-    total_raw = con.execute("SELECT COUNT(*) FROM permits_union").fetchone()[0]
-    print(f"    Union total: {total_raw:,}")
+    # ── Union + derive climate fields ──
+    print("  Loading permit sets + deriving climate fields ...")
 
     con.execute("""
         CREATE OR REPLACE TABLE permits AS
-        WITH derived AS (
+        WITH norm AS (
+            -- normalize approval_type and the approval year (issue date,
+            -- falling back to create date) once; everything below reuses them
+            SELECT *,
+                UPPER(TRIM(approval_type)) AS at_u,
+                YEAR(COALESCE(date_approval_issue, date_approval_create)) AS _year
+            FROM permits_union
+        ),
+        derived AS (
             SELECT
                 *,
                 -- zip code from address (SD zips: 920xx-921xx)
-                CASE
-                    WHEN REGEXP_EXTRACT(address, '(9[12][0-9]{3})', 1) != ''
-                    THEN REGEXP_EXTRACT(address, '(9[12][0-9]{3})', 1)
-                    ELSE NULL
-                END AS zip_code,
+                NULLIF(REGEXP_EXTRACT(address, '9[12][0-9]{3}'), '') AS zip_code,
 
                 -- approval timeline
                 CASE
@@ -144,60 +223,60 @@ def _transform_permits(con: duckdb.DuckDBPyConnection) -> None:
                 END AS approval_days,
 
                 -- year/month from issue date (fallback to create date)
-                YEAR(COALESCE(date_approval_issue, date_approval_create))  AS approval_year,
+                _year                                                      AS approval_year,
                 MONTH(COALESCE(date_approval_issue, date_approval_create)) AS approval_month,
 
                 -- is_solar
                 CASE
-                    WHEN UPPER(TRIM(approval_type)) LIKE '%PHOTOVOLTAIC%'
-                      OR UPPER(TRIM(approval_type)) LIKE '%PV%'
-                      OR UPPER(TRIM(approval_type)) LIKE '%SOLAR%'
+                    WHEN at_u LIKE '%PHOTOVOLTAIC%'
+                      OR at_u LIKE '%PV%'
+                      OR at_u LIKE '%SOLAR%'
                     THEN TRUE
                     ELSE FALSE
                 END AS is_solar,
 
                 -- is_electrical (potential EV chargers, electrical upgrades)
                 CASE
-                    WHEN UPPER(TRIM(approval_type)) LIKE '%ELECTRICAL%'
+                    WHEN at_u LIKE '%ELECTRICAL%'
                     THEN TRUE
                     ELSE FALSE
                 END AS is_electrical,
 
                 -- is_mechanical (HVAC upgrades)
                 CASE
-                    WHEN UPPER(TRIM(approval_type)) LIKE '%MECHANICAL%'
+                    WHEN at_u LIKE '%MECHANICAL%'
                     THEN TRUE
                     ELSE FALSE
                 END AS is_mechanical,
 
                 -- permit_category
                 CASE
-                    WHEN UPPER(TRIM(approval_type)) LIKE '%PHOTOVOLTAIC%'
-                      OR UPPER(TRIM(approval_type)) LIKE '%PV%'
-                      OR UPPER(TRIM(approval_type)) LIKE '%SOLAR%'
+                    WHEN at_u LIKE '%PHOTOVOLTAIC%'
+                      OR at_u LIKE '%PV%'
+                      OR at_u LIKE '%SOLAR%'
                     THEN 'Solar/PV'
-                    WHEN UPPER(TRIM(approval_type)) LIKE '%ELECTRICAL%'
+                    WHEN at_u LIKE '%ELECTRICAL%'
                     THEN 'Electrical'
-                    WHEN UPPER(TRIM(approval_type)) LIKE '%MECHANICAL%'
+                    WHEN at_u LIKE '%MECHANICAL%'
                     THEN 'Mechanical/HVAC'
-                    WHEN UPPER(TRIM(approval_type)) LIKE '%COMBINATION BUILDING%'
-                      OR UPPER(TRIM(approval_type)) = 'BUILDING PERMIT'
-                      OR UPPER(TRIM(approval_type)) LIKE 'BUILDING PERMIT%'
+                    WHEN at_u LIKE '%COMBINATION BUILDING%'
+                      OR at_u = 'BUILDING PERMIT'
+                      OR at_u LIKE 'BUILDING PERMIT%'
                     THEN 'Building'
                     ELSE 'Other'
-                END AS permit_category,
+                END::permit_category_t AS permit_category,
 
                 -- policy_era
                 CASE
-                    WHEN YEAR(COALESCE(date_approval_issue, date_approval_create)) < 2015
+                    WHEN _year < 2015
                     THEN 'Pre-CAP'
-                    WHEN YEAR(COALESCE(date_approval_issue, date_approval_create)) BETWEEN 2015 AND 2017
+                    WHEN _year BETWEEN 2015 AND 2017
                     THEN 'CAP Adopted'
-                    WHEN YEAR(COALESCE(date_approval_issue, date_approval_create)) >= 2018
+                    WHEN _year >= 2018
                     THEN 'Expedited Era'
                     ELSE NULL
-                END AS policy_era
-            FROM permits_union
+                END::policy_era_t AS policy_era
+            FROM norm
         ),
         with_climate AS (
             SELECT
@@ -205,61 +284,78 @@ def _transform_permits(con: duckdb.DuckDBPyConnection) -> None:
                 (is_solar OR is_electrical OR is_mechanical) AS is_climate_relevant
             FROM derived
         ),
+        -- QUALIFY keeps the latest row per approval_id without a separate
+        -- numbered projection
         deduped AS (
-            SELECT *,
-                ROW_NUMBER() OVER (
-                    PARTITION BY approval_id
-                    ORDER BY date_approval_close DESC NULLS LAST
-                ) AS _rn
-            FROM with_climate
+            SELECT * FROM with_climate
+            QUALIFY ROW_NUMBER() OVER (
+                PARTITION BY approval_id
+                ORDER BY date_approval_close DESC NULLS LAST
+            ) = 1
         )
-        SELECT * EXCLUDE (_rn)
+        SELECT * EXCLUDE (at_u, _year)
         FROM deduped
-        WHERE _rn = 1
-          AND (lat IS NULL OR (lat BETWEEN 32.5 AND 33.3))
-          AND (lng IS NULL OR (lng BETWEEN -117.7 AND -116.8))
     """)
 
-    final_count = con.execute("SELECT COUNT(*) FROM permits").fetchone()[0]
-    solar_count = con.execute("SELECT COUNT(*) FROM permits WHERE is_solar").fetchone()[0]
+    final_count, solar_count = con.execute(
+        "SELECT COUNT(*), COUNT(*) FILTER (WHERE is_solar) FROM permits"
+    ).fetchone()
     print(f"    Final permits: {final_count:,} ({solar_count:,} solar)")
 
     # ── Export main parquet ──
     print(f"  Exporting {_PERMITS_PARQUET} ...")
     con.execute(f"""
-        COPY permits TO '{_PERMITS_PARQUET}'
-        (FORMAT PARQUET, CODEC 'ZSTD')
+        -- year-ordered, so row-group min/max stats on approval_year let
+        -- year filters skip whole groups
+        COPY (SELECT * FROM permits ORDER BY approval_year) TO '{_PERMITS_PARQUET}'
+        ({_PARQUET_OPTS})
     """)
     size_mb = Path(_PERMITS_PARQUET).stat().st_size / (1024 * 1024)
     print(f"    climate_permits.parquet: {size_mb:.1f} MB")
+    _save_stage_digest("permits", digest)
 
 
-def _transform_energy(con: duckdb.DuckDBPyConnection) -> None:
+def _transform_energy(con: duckdb.DuckDBPyConnection, force: bool = False) -> None:
     """Load and process SDG&E energy consumption data."""
 
-    sdge_files = sorted(_SDGE.glob("SDGE-*.csv"))
+    # Locally, ingest's manifest lists the files and their sizes, and stands
+    # in for them in the digest (it is rewritten only when they change);
+    # without one (files placed by hand), fall back to glob + stat.
+    manifest = _SDGE / SDGE_MANIFEST.name
+    digest = None
+    if STREAM:
+        sdge_files = sdge_published_urls()
+    elif manifest.exists():
+        sizes = json.loads(manifest.read_text())
+        sdge_files = [str(_SDGE / name) for name, size in sorted(sizes.items()) if size > 0]
+        digest = _stage_digest([manifest])
+    else:
+        paths = [f for f in sorted(_SDGE.glob("SDGE-*.csv")) if f.stat().st_size > 0]
+        sdge_files = [str(f) for f in paths]
+        digest = _stage_digest(paths)
     if not sdge_files:
         print("  [warn] No SDG&E energy files found, skipping energy transform")
         return
+    if not force and _stage_is_current("energy", digest, _ENERGY_PARQUET):
+        print("  SDG&E files unchanged, reusing energy_consumption.parquet")
+        con.execute(f"""
+            CREATE OR REPLACE VIEW elec AS
+            SELECT zip_code, month, year, customer_class, total_customers, total_kwh, avg_kwh, fuel_type
+            FROM read_parquet('{_ENERGY_PARQUET}') WHERE fuel_type = 'electricity';
+            CREATE OR REPLACE VIEW gas AS
+            SELECT zip_code, month, year, customer_class, total_customers, total_thm, avg_thm, fuel_type
+            FROM read_parquet('{_ENERGY_PARQUET}') WHERE fuel_type = 'gas';
+        """)
+        return
 
-    elec_files = [str(f) for f in sdge_files if "ELEC" in f.name and f.stat().st_size > 0]
-    gas_files = [str(f) for f in sdge_files if "GAS" in f.name and f.stat().st_size > 0]
+    elec_files = [f for f in sdge_files if "-ELEC-" in f]
+    gas_files = [f for f in sdge_files if "-GAS-" in f]
 
     # ── Electricity ──
     if elec_files:
         print(f"  Loading {len(elec_files)} electricity files ...")
         file_list = ", ".join(f"'{f}'" for f in elec_files)
         con.execute(f"""
-            CREATE OR REPLACE TABLE elec_raw AS
-            SELECT * FROM read_csv(
-                [{file_list}],
-                union_by_name = true,
-                auto_detect = true,
-                ignore_errors = true
-            )
-        """)
-
-        con.execute("""
             CREATE OR REPLACE TABLE elec AS
             SELECT
                 CAST("ZipCode" AS VARCHAR) AS zip_code,
@@ -270,11 +366,17 @@ def _transform_energy(con: duckdb.DuckDBPyConnection) -> None:
                 TRY_CAST("TotalkWh" AS DOUBLE) AS total_kwh,
                 TRY_CAST("AveragekWh" AS DOUBLE) AS avg_kwh,
                 'electricity' AS fuel_type
-            FROM elec_raw
+            FROM read_csv(
+                [{file_list}],
+                union_by_name = true,
+                auto_detect = true,
+                ignore_errors = true
+            )
             WHERE CAST("ZipCode" AS VARCHAR) LIKE '92%'
         """)
-        elec_rows = con.execute("SELECT COUNT(*) FROM elec").fetchone()[0]
-        print(f"    Electricity rows (SD zips): {elec_rows:,}")
+        if _VERBOSE:
+            elec_rows = con.execute("SELECT COUNT(*) FROM elec").fetchone()[0]
+            print(f"    Electricity rows (SD zips): {elec_rows:,}")
     else:
         con.execute("CREATE TABLE elec (zip_code VARCHAR, month INTEGER, year INTEGER, customer_class VARCHAR, total_customers INTEGER, total_kwh DOUBLE, avg_kwh DOUBLE, fuel_type VARCHAR)")
 
@@ -283,16 +385,6 @@ def _transform_energy(con: duckdb.DuckDBPyConnection) -> None:
         print(f"  Loading {len(gas_files)} gas files ...")
         file_list = ", ".join(f"'{f}'" for f in gas_files)
         con.execute(f"""
-            CREATE OR REPLACE TABLE gas_raw AS
-            SELECT * FROM read_csv(
-                [{file_list}],
-                union_by_name = true,
-                auto_detect = true,
-                ignore_errors = true
-            )
-        """)
-
-        con.execute("""
             CREATE OR REPLACE TABLE gas AS
             SELECT
                 CAST("ZipCode" AS VARCHAR) AS zip_code,
@@ -303,17 +395,26 @@ def _transform_energy(con: duckdb.DuckDBPyConnection) -> None:
                 TRY_CAST("TotalTherms" AS DOUBLE) AS total_thm,
                 TRY_CAST("AverageTherms" AS DOUBLE) AS avg_thm,
                 'gas' AS fuel_type
-            FROM gas_raw
+            FROM read_csv(
+                [{file_list}],
+                union_by_name = true,
+                auto_detect = true,
+                ignore_errors = true
+            )
             WHERE CAST("ZipCode" AS VARCHAR) LIKE '92%'
         """)
-        gas_rows = con.execute("SELECT COUNT(*) FROM gas").fetchone()[0]
-        print(f"    Gas rows (SD zips): {gas_rows:,}")
+        if _VERBOSE:
+            gas_rows = con.execute("SELECT COUNT(*) FROM gas").fetchone()[0]
+            print(f"    Gas rows (SD zips): {gas_rows:,}")
     else:
         con.execute("CREATE TABLE gas (zip_code VARCHAR, month INTEGER, year INTEGER, customer_class VARCHAR, total_customers INTEGER, total_thm DOUBLE, avg_thm DOUBLE, fuel_type VARCHAR)")
 
-    # ── Combine into unified energy table ──
+    # ── Combine into unified energy view ──
+    # Only the exported parquet needs one row shape for both fuels; as a view
+    # the NULL-padded union streams into the COPY and the aggregations read
+    # elec and gas directly.
     con.execute("""
-        CREATE OR REPLACE TABLE energy AS
+        CREATE OR REPLACE VIEW energy AS
         SELECT
             zip_code, month, year, customer_class,
             total_customers,
@@ -331,22 +432,47 @@ def _transform_energy(con: duckdb.DuckDBPyConnection) -> None:
         FROM gas
     """)
 
-    total_energy = con.execute("SELECT COUNT(*) FROM energy").fetchone()[0]
+    total_energy = con.execute(
+        "SELECT (SELECT COUNT(*) FROM elec) + (SELECT COUNT(*) FROM gas)"
+    ).fetchone()[0]
     print(f"    Combined energy rows: {total_energy:,}")
 
     # ── Export energy parquet ──
+    # Year-first sort so row-group min/max stats let year/zip filters skip groups
     print(f"  Exporting {_ENERGY_PARQUET} ...")
     con.execute(f"""
-        COPY energy TO '{_ENERGY_PARQUET}'
-        (FORMAT PARQUET, CODEC 'ZSTD')
+        COPY (SELECT * FROM energy ORDER BY year, zip_code, month) TO '{_ENERGY_PARQUET}'
+        ({_PARQUET_OPTS})
     """)
     if Path(_ENERGY_PARQUET).exists():
         size_mb = Path(_ENERGY_PARQUET).stat().st_size / (1024 * 1024)
         print(f"    energy_consumption.parquet: {size_mb:.1f} MB")
+    _save_stage_digest("energy", digest)
 
 
-def _build_aggregations(con: duckdb.DuckDBPyConnection) -> None:
-    """Build 9 pre-aggregated parquet files for dashboard/API."""
+def _build_aggregations(con: duckdb.DuckDBPyConnection, force: bool = False) -> None:
+    """Build 11 pre-aggregated parquet files for dashboard/API.
+
+    Year-grained outputs are written ordered by year first (approval_speed
+    by era/category, then year), so parquet row-group min/max statistics
+    line up with the filters the API and dashboard apply.
+
+    Each output is deliberately its own query over the in-memory permits
+    table rather than one GROUPING SETS pass: scans of that table are cheap,
+    while a fused query has to evaluate every aggregate (MEDIAN and
+    QUANTILE_CONT included, via FILTER) for every grouping set. Per-output
+    WHERE clauses keep the holistic aggregates on small row subsets.
+
+    Medians and p90 stay exact: approval_days is a small-integer column, and
+    DuckDB's exact quantiles over it measured about twice as fast as
+    APPROX_QUANTILE's t-digest (and give reproducible published figures).
+    """
+
+    inputs = [Path(p) for p in (_PERMITS_PARQUET, _ENERGY_PARQUET) if Path(p).exists()]
+    digest = _stage_digest(inputs)
+    if not force and _stage_is_current("aggregations", digest, _AGG / "facts_year.parquet"):
+        print("  Processed parquets unchanged, keeping existing aggregations")
+        return
 
     # 1. solar_annual — annual solar count, cumulative, valuation, median approval days
     print("  Aggregating: solar_annual ...")
@@ -366,15 +492,15 @@ def _build_aggregations(con: duckdb.DuckDBPyConnection) -> None:
                     COUNT(*) AS solar_count,
                     SUM(COALESCE(valuation, 0))::BIGINT AS total_valuation,
                     MEDIAN(approval_days) AS median_approval_days,
-                    MEDIAN(CASE WHEN approval_days > 0 THEN approval_days END) AS median_approval_days_nonzero,
-                    SUM(CASE WHEN approval_days = 0 THEN 1 ELSE 0 END) AS same_day_count
+                    MEDIAN(approval_days) FILTER (WHERE approval_days > 0) AS median_approval_days_nonzero,
+                    COUNT(*) FILTER (WHERE approval_days = 0) AS same_day_count
                 FROM permits
                 WHERE is_solar = TRUE AND approval_year IS NOT NULL
                 GROUP BY approval_year
             )
             ORDER BY year
         ) TO '{_AGG}/solar_annual.parquet'
-        (FORMAT PARQUET, CODEC 'ZSTD')
+        ({_PARQUET_OPTS})
     """)
 
     # 2. solar_by_zip — solar permits by zip + year
@@ -390,12 +516,13 @@ def _build_aggregations(con: duckdb.DuckDBPyConnection) -> None:
             FROM permits
             WHERE is_solar = TRUE AND zip_code IS NOT NULL AND approval_year IS NOT NULL
             GROUP BY zip_code, approval_year
-            ORDER BY zip_code, year
+            ORDER BY year, zip_code
         ) TO '{_AGG}/solar_by_zip.parquet'
-        (FORMAT PARQUET, CODEC 'ZSTD')
+        ({_PARQUET_OPTS})
     """)
 
     # 3. approval_speed — median/avg/p90 approval days by category, year, policy_era
+    #    Sorted era/category first: the dashboard filters on those (era implies a year range)
     print("  Aggregating: approval_speed ...")
     con.execute(f"""
         COPY (
@@ -405,15 +532,15 @@ def _build_aggregations(con: duckdb.DuckDBPyConnection) -> None:
                 policy_era,
                 COUNT(*) AS permit_count,
                 MEDIAN(approval_days) AS median_days,
-                MEDIAN(CASE WHEN approval_days > 0 THEN approval_days END) AS median_days_nonzero,
+                MEDIAN(approval_days) FILTER (WHERE approval_days > 0) AS median_days_nonzero,
                 AVG(approval_days)::INTEGER AS avg_days,
                 QUANTILE_CONT(approval_days, 0.9)::INTEGER AS p90_days
             FROM permits
             WHERE approval_days IS NOT NULL AND approval_year IS NOT NULL
             GROUP BY approval_year, permit_category, policy_era
-            ORDER BY year, permit_category
+            ORDER BY policy_era, permit_category, year
         ) TO '{_AGG}/approval_speed.parquet'
-        (FORMAT PARQUET, CODEC 'ZSTD')
+        ({_PARQUET_OPTS})
     """)
 
     # 4. climate_permits_monthly — monthly counts by permit_category
@@ -430,11 +557,17 @@ def _build_aggregations(con: duckdb.DuckDBPyConnection) -> None:
             GROUP BY approval_year, approval_month, permit_category
             ORDER BY year, month, permit_category
         ) TO '{_AGG}/climate_permits_monthly.parquet'
-        (FORMAT PARQUET, CODEC 'ZSTD')
+        ({_PARQUET_OPTS})
     """)
 
     # 5. solar_map_points — lat/lng for solar permits only
+    #    Hive-partitioned by year (solar_map_points/year=YYYY/*.parquet) so
+    #    year filters skip whole files. The directory is rebuilt each run, and
+    #    the single-file layout older runs wrote is removed.
     print("  Aggregating: solar_map_points ...")
+    map_dir = _AGG / "solar_map_points"
+    shutil.rmtree(map_dir, ignore_errors=True)
+    (_AGG / "solar_map_points.parquet").unlink(missing_ok=True)
     con.execute(f"""
         COPY (
             SELECT
@@ -446,8 +579,8 @@ def _build_aggregations(con: duckdb.DuckDBPyConnection) -> None:
                 policy_era
             FROM permits
             WHERE is_solar = TRUE AND lat IS NOT NULL AND lng IS NOT NULL
-        ) TO '{_AGG}/solar_map_points.parquet'
-        (FORMAT PARQUET, CODEC 'ZSTD')
+        ) TO '{map_dir}'
+        ({_PARQUET_OPTS}, PARTITION_BY (year))
     """)
 
     # 6. energy_permits_annual — annual counts for solar/electrical/mechanical
@@ -456,16 +589,16 @@ def _build_aggregations(con: duckdb.DuckDBPyConnection) -> None:
         COPY (
             SELECT
                 approval_year AS year,
-                SUM(CASE WHEN is_solar THEN 1 ELSE 0 END) AS solar_count,
-                SUM(CASE WHEN is_electrical THEN 1 ELSE 0 END) AS electrical_count,
-                SUM(CASE WHEN is_mechanical THEN 1 ELSE 0 END) AS mechanical_count,
-                SUM(CASE WHEN is_climate_relevant THEN 1 ELSE 0 END) AS climate_total
+                COUNT(*) FILTER (WHERE is_solar) AS solar_count,
+                COUNT(*) FILTER (WHERE is_electrical) AS electrical_count,
+                COUNT(*) FILTER (WHERE is_mechanical) AS mechanical_count,
+                COUNT(*) FILTER (WHERE is_climate_relevant) AS climate_total
             FROM permits
             WHERE approval_year IS NOT NULL
             GROUP BY approval_year
             ORDER BY year
         ) TO '{_AGG}/energy_permits_annual.parquet'
-        (FORMAT PARQUET, CODEC 'ZSTD')
+        ({_PARQUET_OPTS})
     """)
 
     # 7. zip_code_summary — per-zip totals
@@ -475,69 +608,155 @@ def _build_aggregations(con: duckdb.DuckDBPyConnection) -> None:
             SELECT
                 zip_code,
                 COUNT(*) AS total_permits,
-                SUM(CASE WHEN is_solar THEN 1 ELSE 0 END) AS solar_count,
-                SUM(CASE WHEN is_electrical THEN 1 ELSE 0 END) AS electrical_count,
-                SUM(CASE WHEN is_mechanical THEN 1 ELSE 0 END) AS mechanical_count,
-                SUM(CASE WHEN is_climate_relevant THEN 1 ELSE 0 END) AS climate_count,
-                ROUND(SUM(CASE WHEN is_solar THEN 1 ELSE 0 END) * 100.0 / COUNT(*), 2) AS solar_pct,
+                COUNT(*) FILTER (WHERE is_solar) AS solar_count,
+                COUNT(*) FILTER (WHERE is_electrical) AS electrical_count,
+                COUNT(*) FILTER (WHERE is_mechanical) AS mechanical_count,
+                COUNT(*) FILTER (WHERE is_climate_relevant) AS climate_count,
+                ROUND(COUNT(*) FILTER (WHERE is_solar) * 100.0 / COUNT(*), 2) AS solar_pct,
                 SUM(COALESCE(valuation, 0))::BIGINT AS total_valuation
             FROM permits
             WHERE zip_code IS NOT NULL
             GROUP BY zip_code
             ORDER BY solar_count DESC
         ) TO '{_AGG}/zip_code_summary.parquet'
-        (FORMAT PARQUET, CODEC 'ZSTD')
+        ({_PARQUET_OPTS})
     """)
 
     # 8. energy_by_zip_annual — annual electricity + gas consumption by zip (residential)
-    _has_energy = con.execute("SELECT COUNT(*) FROM energy").fetchone()[0] > 0
+    #    Each fuel is grouped on its own table, then the two are joined, so no
+    #    step carries the other fuel's NULL columns.
+    _has_energy = con.execute(
+        "SELECT EXISTS (SELECT 1 FROM elec) OR EXISTS (SELECT 1 FROM gas)"
+    ).fetchone()[0]
     if _has_energy:
         print("  Aggregating: energy_by_zip_annual ...")
         con.execute(f"""
             COPY (
+                WITH e AS (
+                    SELECT zip_code, year, SUM(total_kwh) AS total_kwh, SUM(total_customers) AS customers
+                    FROM elec
+                    WHERE customer_class = 'R' AND year IS NOT NULL
+                    GROUP BY zip_code, year
+                ),
+                g AS (
+                    SELECT zip_code, year, SUM(total_thm) AS total_thm, SUM(total_customers) AS customers
+                    FROM gas
+                    WHERE customer_class = 'R' AND year IS NOT NULL
+                    GROUP BY zip_code, year
+                )
                 SELECT
                     zip_code,
                     year,
-                    SUM(CASE WHEN fuel_type = 'electricity' THEN total_kwh ELSE 0 END)::BIGINT AS total_kwh,
-                    SUM(CASE WHEN fuel_type = 'electricity' THEN total_customers ELSE 0 END) AS elec_customers,
-                    CASE
-                        WHEN SUM(CASE WHEN fuel_type = 'electricity' THEN total_customers ELSE 0 END) > 0
-                        THEN (SUM(CASE WHEN fuel_type = 'electricity' THEN total_kwh ELSE 0 END)
-                              / SUM(CASE WHEN fuel_type = 'electricity' THEN total_customers ELSE 0 END))::INTEGER
-                        ELSE NULL
-                    END AS avg_kwh_per_customer,
-                    SUM(CASE WHEN fuel_type = 'gas' THEN total_thm ELSE 0 END)::BIGINT AS total_thm,
-                    SUM(CASE WHEN fuel_type = 'gas' THEN total_customers ELSE 0 END) AS gas_customers
-                FROM energy
-                WHERE customer_class = 'R' AND year IS NOT NULL
-                GROUP BY zip_code, year
-                ORDER BY zip_code, year
+                    COALESCE(e.total_kwh, 0)::BIGINT AS total_kwh,
+                    COALESCE(e.customers, 0) AS elec_customers,
+                    (COALESCE(e.total_kwh, 0) / NULLIF(e.customers, 0))::INTEGER AS avg_kwh_per_customer,
+                    COALESCE(g.total_thm, 0)::BIGINT AS total_thm,
+                    COALESCE(g.customers, 0) AS gas_customers
+                FROM e
+                FULL OUTER JOIN g USING (zip_code, year)
+                ORDER BY year, zip_code
             ) TO '{_AGG}/energy_by_zip_annual.parquet'
-            (FORMAT PARQUET, CODEC 'ZSTD')
+            ({_PARQUET_OPTS})
         """)
 
         # 9. energy_trends — citywide quarterly electricity + gas totals
         print("  Aggregating: energy_trends ...")
         con.execute(f"""
             COPY (
+                WITH e AS (
+                    SELECT year, ((month - 1) // 3 + 1) AS quarter, customer_class,
+                        SUM(total_kwh) AS total_kwh, SUM(total_customers) AS customers
+                    FROM elec
+                    WHERE year IS NOT NULL
+                    GROUP BY ALL
+                ),
+                g AS (
+                    SELECT year, ((month - 1) // 3 + 1) AS quarter, customer_class,
+                        SUM(total_thm) AS total_thm, SUM(total_customers) AS customers
+                    FROM gas
+                    WHERE year IS NOT NULL
+                    GROUP BY ALL
+                )
                 SELECT
-                    year,
-                    ((month - 1) // 3 + 1) AS quarter,
-                    customer_class,
-                    SUM(CASE WHEN fuel_type = 'electricity' THEN total_kwh ELSE 0 END)::BIGINT AS total_kwh,
-                    SUM(CASE WHEN fuel_type = 'electricity' THEN total_customers ELSE 0 END) AS elec_customers,
-                    SUM(CASE WHEN fuel_type = 'gas' THEN total_thm ELSE 0 END)::BIGINT AS total_thm,
-                    SUM(CASE WHEN fuel_type = 'gas' THEN total_customers ELSE 0 END) AS gas_customers
-                FROM energy
-                WHERE year IS NOT NULL
-                GROUP BY year, ((month - 1) // 3 + 1), customer_class
+                    COALESCE(e.year, g.year) AS year,
+                    COALESCE(e.quarter, g.quarter) AS quarter,
+                    COALESCE(e.customer_class, g.customer_class) AS customer_class,
+                    COALESCE(e.total_kwh, 0)::BIGINT AS total_kwh,
+                    COALESCE(e.customers, 0) AS elec_customers,
+                    COALESCE(g.total_thm, 0)::BIGINT AS total_thm,
+                    COALESCE(g.customers, 0) AS gas_customers
+                FROM e
+                -- quarter/customer_class can be NULL on malformed rows; they
+                -- still have to pair up across fuels
+                FULL OUTER JOIN g
+                    ON e.year = g.year
+                    AND e.quarter IS NOT DISTINCT FROM g.quarter
+                    AND e.customer_class IS NOT DISTINCT FROM g.customer_class
                 ORDER BY year, quarter, customer_class
             ) TO '{_AGG}/energy_trends.parquet'
-            (FORMAT PARQUET, CODEC 'ZSTD')
+            ({_PARQUET_OPTS})
+        """)
+
+        # 10. energy_vs_solar_by_zip — solar_by_zip and energy_by_zip_annual
+        #     pre-joined per (zip, year), so the API's energy-vs-solar query
+        #     is a single grouped scan with no join
+        print("  Aggregating: energy_vs_solar_by_zip ...")
+        con.execute(f"""
+            COPY (
+                SELECT
+                    zip_code,
+                    year,
+                    s.solar_count,
+                    e.avg_kwh_per_customer,
+                    e.total_kwh
+                FROM '{_AGG}/solar_by_zip.parquet' s
+                FULL OUTER JOIN '{_AGG}/energy_by_zip_annual.parquet' e
+                    USING (zip_code, year)
+                ORDER BY year, zip_code
+            ) TO '{_AGG}/energy_vs_solar_by_zip.parquet'
+            ({_PARQUET_OPTS})
         """)
     else:
         print("  [skip] energy aggregations (no energy data)")
 
+    # 11. facts_year — one row per year for the dashboard: solar_annual,
+    #     energy_permits_annual and residential kWh side by side, so every
+    #     year-grain chart reads one file. Built from the files written above.
+    print("  Aggregating: facts_year ...")
+    res_kwh = (
+        f"""
+        SELECT year, SUM(total_kwh)::BIGINT AS residential_kwh
+        FROM '{_AGG}/energy_trends.parquet'
+        WHERE customer_class = 'R'
+        GROUP BY year
+        """
+        if _has_energy
+        else "SELECT NULL::BIGINT AS year, NULL::BIGINT AS residential_kwh WHERE false"
+    )
+    con.execute(f"""
+        COPY (
+            WITH res AS ({res_kwh})
+            SELECT
+                year,
+                s.solar_count,
+                s.cumulative_solar,
+                s.total_valuation,
+                s.median_approval_days,
+                s.median_approval_days_nonzero,
+                s.same_day_count,
+                p.electrical_count,
+                p.mechanical_count,
+                p.climate_total,
+                res.residential_kwh
+            FROM '{_AGG}/energy_permits_annual.parquet' p
+            FULL OUTER JOIN '{_AGG}/solar_annual.parquet' s USING (year)
+            FULL OUTER JOIN res USING (year)
+            ORDER BY year
+        ) TO '{_AGG}/facts_year.parquet'
+        ({_PARQUET_OPTS})
+    """)
+
+    _save_stage_digest("aggregations", digest)
     print("  All aggregations complete.")
 
 